@@ -29,6 +29,11 @@ setuptools.setup(
     # Dependencies/Other modules required for your package to work
     install_requires=['feedparser'],
 
+    # Optional dependencies
+    extras_require={
+        'zstd': ['zstandard'],
+    },
+
     # Detailed description of your package
     long_description='Python RSS-reader command line tool',
 
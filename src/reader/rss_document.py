@@ -46,17 +46,28 @@ class RssItem:
 
 
 class RssDocument:
-    def __init__(self, title, updated, items):
+    def __init__(self, title, updated, items, hub=None, self_link=None):
         self.title: str = title
         self.updated: str = updated
         self.items: [RssItem] = items
+        self.hub: str = hub
+        self.self_link: str = self_link
 
     @staticmethod
     def parse(d: feedparser.FeedParserDict):
+        def link(rel):
+            for link in d['feed'].get('links', []):
+                if link.get('rel') == rel and link.get('href'):
+                    return link['href']
+            return None
+
         result = RssDocument(
             title=d['feed']['title'],
-            updated=d['updated'],
+            # document pushed by WebSub hub has no http headers, so feed's own update time is used
+            updated=d.get('updated') or d['feed']['updated'],
             items=[RssItem.parse(item) for item in d['items']],
+            hub=link('hub'),
+            self_link=link('self'),
         )
         logger.debug("Parsed RssDocument %s", result)
         return result
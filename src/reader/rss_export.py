@@ -0,0 +1,188 @@
+import csv
+import gzip
+import io
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from reader.rss_document import RssDocument, RssItem
+from reader.rss_exception import RssException
+
+logger = logging.getLogger(__file__)
+
+
+class RssExportException(RssException):
+    pass
+
+
+def compress(data: bytes, compression):
+    if compression == 'gzip':
+        return gzip.compress(data, compresslevel=6)
+    if compression == 'zstd':
+        try:
+            import zstandard
+        except ImportError as e:
+            raise RssExportException("zstd compression requires package zstandard (pip install .[zstd])", e)
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    if compression == 'none':
+        return data
+    raise RssExportException(f"Unknown compression {compression}")
+
+
+class RssExporter:
+    """
+    Streams cached items into compressed chunk files. Chunks are serialized, compressed and written in parallel
+    """
+    FORMATS = ('jsonl', 'csv', 'columnar')
+    COMPRESSIONS = ('gzip', 'zstd', 'none')
+    CHUNK_BY = ('day', 'size')
+    COLUMNS = ('feed', 'title', 'link', 'published_date', 'image_link')
+    EXTENSIONS = {'jsonl': 'jsonl', 'csv': 'csv', 'columnar': 'columns.jsonl'}
+    COMPRESSION_EXTENSIONS = {'gzip': '.gz', 'zstd': '.zst', 'none': ''}
+
+    def __init__(self,
+                 output_dir,
+                 export_format='jsonl',
+                 compression='gzip',
+                 columns=COLUMNS,
+                 chunk_by='day',
+                 chunk_size=100000,
+                 chunk_bytes=None,
+                 max_buffered_rows=None,
+                 workers=os.cpu_count()):
+        for value, allowed, name in [
+            (export_format, self.FORMATS, 'format'),
+            (compression, self.COMPRESSIONS, 'compression'),
+            (chunk_by, self.CHUNK_BY, 'chunk'),
+        ]:
+            if value not in allowed:
+                raise RssExportException(f"Unknown export {name} {value}, expected one of {allowed}")
+        unknown_columns = [c for c in columns if c not in self.COLUMNS]
+        if unknown_columns:
+            raise RssExportException(f"Unknown columns {unknown_columns}, expected some of {self.COLUMNS}")
+        self.output_dir = output_dir
+        self.export_format = export_format
+        self.compression = compression
+        self.columns = list(columns)
+        self.chunk_by = chunk_by
+        self.chunk_size = chunk_size
+        self.chunk_bytes = chunk_bytes
+        self.max_buffered_rows = max_buffered_rows or chunk_size
+        self.workers = workers
+
+    def export(self, documents, date_from: datetime = None, date_to: datetime = None):
+        """
+        Exports items of documents published between date_from and date_to (both inclusive, when specified).
+        Chunk contains at most chunk_size items and, when chunk_bytes is specified, at most chunk_bytes bytes
+        before compression (unless single item is larger). Documents are consumed lazily. At most max_buffered_rows
+        rows are buffered, when exceeded the largest buffer is written as a chunk, and at most workers chunks are
+        being written at once. Returns written files
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        buffers = {}
+        sizes = {}
+        buffered = 0
+        parts = {}
+        in_flight = threading.BoundedSemaphore(self.workers)
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = []
+
+            def flush(key):
+                nonlocal buffered
+                rows = buffers.pop(key)
+                sizes.pop(key, None)
+                buffered -= len(rows)
+                parts[key] = parts.get(key, 0) + 1
+                # blocks reading while all workers are busy, so chunks do not pile up in memory
+                in_flight.acquire()
+                future = executor.submit(self.write_chunk, key, parts[key], rows)
+                future.add_done_callback(lambda f: in_flight.release())
+                futures.append(future)
+
+            for document in documents:
+                for item in document.items:
+                    day = self.published_day(item)
+                    if (date_from or date_to) and day is None:
+                        continue
+                    if date_from and day < date_from or date_to and day > date_to:
+                        continue
+                    key = (day.strftime("%Y%m%d") if day else "unknown") if self.chunk_by == 'day' else "all"
+                    row = self.row(document, item)
+                    if self.chunk_bytes:
+                        size = self.row_size(row)
+                        if key in buffers and sizes[key] + size > self.chunk_bytes:
+                            flush(key)
+                        sizes[key] = sizes.get(key, self.header_size()) + size
+                    buffers.setdefault(key, []).append(row)
+                    buffered += 1
+                    if len(buffers[key]) >= self.chunk_size:
+                        flush(key)
+                    elif buffered >= self.max_buffered_rows:
+                        flush(max(buffers, key=lambda k: len(buffers[k])))
+            for key in list(buffers):
+                flush(key)
+            files = [f.result() for f in futures]
+        logger.debug("Exported files %s", files)
+        return files
+
+    @staticmethod
+    def published_day(item: RssItem):
+        try:
+            return item.published_day()
+        except (TypeError, ValueError):
+            return None
+
+    def row(self, document: RssDocument, item: RssItem):
+        values = {
+            'feed': document.title,
+            'title': item.title,
+            'link': item.link,
+            'published_date': item.published_date,
+            'image_link': item.image_link,
+        }
+        return [values[c] for c in self.columns]
+
+    def header_size(self):
+        return len(self.serialize([]).encode("utf-8"))
+
+    def row_size(self, row):
+        """
+        Returns size of row in serialized chunk, size of columnar row is estimated by size of its values
+        """
+        if self.export_format == 'columnar':
+            return len(json.dumps(row, separators=(',', ':')).encode("utf-8"))
+        return len(self.serialize([row]).encode("utf-8")) - self.header_size()
+
+    def write_chunk(self, key, part, rows):
+        name = f"rss-{key}-{part:05d}.{self.EXTENSIONS[self.export_format]}" \
+               f"{self.COMPRESSION_EXTENSIONS[self.compression]}"
+        file = self.output_dir + os.path.sep + name
+        data = compress(self.serialize(rows).encode("utf-8"), self.compression)
+        try:
+            with open(file + ".tmp", "wb") as f:
+                f.write(data)
+            os.replace(file + ".tmp", file)
+        except OSError as e:
+            raise RssExportException(f"Failed to write export file {file}", e)
+        logger.debug("Export chunk written [file=%s, rows=%s, bytes=%s]", file, len(rows), len(data))
+        return file
+
+    def serialize(self, rows):
+        result = io.StringIO()
+        if self.export_format == 'jsonl':
+            for row in rows:
+                result.write(json.dumps(dict(zip(self.columns, row)), separators=(',', ':')))
+                result.write("\n")
+        elif self.export_format == 'csv':
+            writer = csv.writer(result, lineterminator="\n")
+            writer.writerow(self.columns)
+            writer.writerows(rows)
+        else:
+            # one line per column, similar values are stored together and compress better
+            for i, column in enumerate(self.columns):
+                result.write(json.dumps({'column': column, 'values': [row[i] for row in rows]}, separators=(',', ':')))
+                result.write("\n")
+        return result.getvalue()
@@ -0,0 +1,76 @@
+import hashlib
+import json
+import logging
+import os
+
+from reader.rss_document import RssDocument
+
+logger = logging.getLogger(__file__)
+
+
+def fingerprint(*values):
+    digest = hashlib.sha1()
+    for value in values:
+        digest.update(value if isinstance(value, bytes) else str(value).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def document_fingerprint(document: RssDocument):
+    """
+    Fingerprint of everything stored in cache and rendered from document
+    """
+    return fingerprint(document.title, document.updated, *[
+        fingerprint(i.title, i.link, i.published_date, i.image_link) for i in document.items
+    ])
+
+
+class RssFingerprints:
+    """
+    Fingerprints of feed body and document stored in cache, and of outputs generated from the cache.
+    Used to skip parsing, storing and rendering of feeds which did not change since they were stored
+    """
+
+    def __init__(self, fingerprints_file):
+        self.fingerprints_file = fingerprints_file
+        self.state = self.load()
+
+    def load(self):
+        if not os.path.exists(self.fingerprints_file):
+            return {}
+        try:
+            with open(self.fingerprints_file, "r") as file:
+                return json.load(file)
+        except (OSError, ValueError) as e:
+            logger.warning("Failed to load fingerprints from %s", self.fingerprints_file, exc_info=e)
+            return {}
+
+    def save(self):
+        try:
+            temp_file = f"{self.fingerprints_file}.{os.getpid()}.tmp"
+            with open(temp_file, "w") as file:
+                json.dump(self.state, file)
+            os.replace(temp_file, self.fingerprints_file)
+        except OSError as e:
+            logger.warning("Failed to save fingerprints to %s", self.fingerprints_file, exc_info=e)
+
+    def same_body(self, url, body: bytes):
+        return self.state.get('url') == url and self.state.get('body') == fingerprint(body)
+
+    def same_document(self, url, document: RssDocument):
+        return self.state.get('url') == url and self.state.get('document') == document_fingerprint(document)
+
+    def update(self, url, body: bytes, document: RssDocument = None):
+        """
+        Records body of url, fingerprint of stored document is kept when not specified
+        """
+        self.state['url'] = url
+        self.state['body'] = fingerprint(body)
+        if document is not None:
+            self.state['document'] = document_fingerprint(document)
+
+    def same_output(self, output, document: RssDocument):
+        return self.state.get('outputs', {}).get(os.path.abspath(output)) == document_fingerprint(document)
+
+    def update_output(self, output, document: RssDocument):
+        self.state.setdefault('outputs', {})[os.path.abspath(output)] = document_fingerprint(document)
@@ -21,6 +21,10 @@ class RssFormatter:
 
 class JsonRssFormatter(RssFormatter):
     def format_internal(self, document: RssDocument):
+        return json.dumps(self.format_dict(document), indent=2)
+
+    @staticmethod
+    def format_dict(document: RssDocument):
         def format_item(i: RssItem):
             return {
                 'title': i.title,
@@ -36,7 +40,7 @@ class JsonRssFormatter(RssFormatter):
                 'items': [format_item(i) for i in d.items],
             }
 
-        return json.dumps(format_document(document), indent=2)
+        return format_document(document)
 
 
 class TextRssFormatter(RssFormatter):
@@ -0,0 +1,198 @@
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # file locking is not available on Windows, concurrent updates may be lost there
+    fcntl = None
+
+from reader.rss_exception import RssException
+
+logger = logging.getLogger(__file__)
+
+
+class RssTokenBucket:
+    """
+    Limits requests to rate per second, allowing bursts of up to burst requests
+    """
+
+    def __init__(self, rate, burst, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = burst
+        self.updated = clock()
+
+    def reserve(self, now):
+        """
+        Takes token and returns seconds to wait until it is available. Tokens of waiting requests are negative
+        """
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate) - 1
+        self.updated = now
+        return max(0.0, -self.tokens / self.rate)
+
+    def acquire(self):
+        self.wait(self.reserve(self.clock()))
+
+    def wait(self, seconds):
+        if seconds > 0:
+            logger.debug("Rate limit reached, waiting %.3fs", seconds)
+            self.sleep(seconds)
+
+
+class RssHostHealth:
+    """
+    Circuit breaker and rate limit of hosts. Host failing failure_threshold times in a row is skipped for cool_down
+    seconds, after that single trial request is let through and the circuit is closed again when it succeeds.
+    When trial request does not finish within cool_down seconds, another one is let through.
+    State is persisted in health_file (when specified), so it survives between runs and is shared by processes
+    using the same file, including token buckets limiting rate of requests to host. Changes are merged into the file
+    per host under file lock.
+    """
+
+    class RssHostUnavailableException(RssException):
+        pass
+
+    def __init__(self, health_file=None, failure_threshold=5, cool_down=300, clock=time.time):
+        self.health_file = health_file
+        self.failure_threshold = failure_threshold
+        self.cool_down = cool_down
+        self.clock = clock
+        self.loaded_mtime = None
+        self.hosts = self.load()
+
+    def file_mtime(self):
+        try:
+            return os.stat(self.health_file).st_mtime_ns
+        except OSError:
+            return None
+
+    def load(self):
+        if not self.health_file:
+            return {}
+        self.loaded_mtime = self.file_mtime()
+        if self.loaded_mtime is None:
+            return {}
+        try:
+            with open(self.health_file, "r") as file:
+                return json.load(file)
+        except (OSError, ValueError) as e:
+            # health state is only optimization, broken file should not stop downloads
+            logger.warning("Failed to load host health from %s", self.health_file, exc_info=e)
+            return {}
+
+    def reload_if_changed(self):
+        if self.health_file and self.file_mtime() != self.loaded_mtime:
+            self.hosts = self.load()
+
+    @contextmanager
+    def locked(self):
+        if fcntl is None:
+            yield
+            return
+        with open(self.health_file + ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def update(self, host, change):
+        """
+        Applies change(hosts) to the latest state of all processes and saves it
+        """
+        if not self.health_file:
+            change(self.hosts)
+            return
+        applied = False
+        try:
+            with self.locked():
+                self.hosts = self.load()
+                change(self.hosts)
+                applied = True
+                temp_file = f"{self.health_file}.{os.getpid()}.tmp"
+                with open(temp_file, "w") as file:
+                    json.dump(self.hosts, file)
+                os.replace(temp_file, self.health_file)
+                self.loaded_mtime = self.file_mtime()
+        except OSError as e:
+            logger.warning("Failed to save health of host %s to %s", host, self.health_file, exc_info=e)
+            if not applied:
+                change(self.hosts)
+
+    def check(self, host):
+        """
+        Raises RssHostUnavailableException when circuit of host is open, or when it is half-open and trial request
+        was already let through
+        """
+        self.reload_if_changed()
+        state = self.hosts.get(host)
+        if not self.is_opened(state):
+            return
+        now = self.clock()
+        if state['open_until'] > now:
+            raise self.RssHostUnavailableException(
+                f"Host {host} is skipped after {state['failures']} failures until {state['open_until']:.0f}")
+        trial = False
+
+        def change(hosts):
+            nonlocal trial
+            current = hosts.get(host)
+            if not self.is_opened(current):
+                trial = True
+            elif current['open_until'] <= now and current.get('trial_until', 0) <= now:
+                current['trial_until'] = now + self.cool_down
+                trial = True
+
+        self.update(host, change)
+        if not trial:
+            raise self.RssHostUnavailableException(f"Host {host} is skipped, trial request is in progress")
+        logger.debug("Trial request to host %s let through", host)
+
+    @staticmethod
+    def is_opened(state):
+        return bool(state) and state.get('open_until', 0) > 0
+
+    def success(self, host):
+        if self.hosts.get(host, {}).get('failures'):
+            def change(hosts):
+                for key in ('failures', 'open_until', 'trial_until'):
+                    hosts.get(host, {}).pop(key, None)
+
+            self.update(host, change)
+            logger.debug("Circuit of host %s closed", host)
+
+    def failure(self, host):
+        def change(hosts):
+            state = hosts.setdefault(host, {})
+            state['failures'] = state.get('failures', 0) + 1
+            if state['failures'] >= self.failure_threshold:
+                state['open_until'] = self.clock() + self.cool_down
+                state.pop('trial_until', None)
+                logger.warning("Circuit of host %s opened after %s failures", host, state['failures'])
+
+        self.update(host, change)
+
+    def acquire(self, host, bucket: RssTokenBucket):
+        """
+        Takes token of bucket limiting rate of requests to host, waiting until it is available.
+        State of bucket is stored with health of host, so the rate is shared by all processes using health_file
+        """
+        wait = 0.0
+
+        def change(hosts):
+            nonlocal wait
+            now = self.clock()
+            state = hosts.setdefault(host, {})
+            bucket.tokens = state.get('tokens', bucket.burst)
+            bucket.updated = state.get('updated', now)
+            wait = bucket.reserve(now)
+            state.update({'tokens': bucket.tokens, 'updated': bucket.updated})
+
+        self.update(host, change)
+        bucket.wait(wait)
@@ -0,0 +1,123 @@
+import logging
+import sqlite3
+import time
+from abc import abstractmethod
+from contextlib import closing
+
+from reader.rss_exception import RssException
+
+logger = logging.getLogger(__file__)
+
+
+class RssWorkQueue:
+    """
+    Shared queue of feed urls polled by workers. Worker leases url for limited time, so url leased by dead worker
+    is given to another worker once the lease expires.
+    """
+
+    class RssWorkQueueException(RssException):
+        pass
+
+    @abstractmethod
+    def add(self, url):
+        raise NotImplemented
+
+    @abstractmethod
+    def lease(self, worker_id, lease_seconds):
+        """
+        Returns url which is due for polling and leases it to worker_id, or None when no url is due
+        """
+        raise NotImplemented
+
+    @abstractmethod
+    def complete(self, url, worker_id, interval):
+        """
+        Releases lease of url and schedules its next poll after interval seconds.
+        Returns False if worker does not hold the lease anymore
+        """
+        raise NotImplemented
+
+    @abstractmethod
+    def urls(self):
+        raise NotImplemented
+
+
+class SqliteRssWorkQueue(RssWorkQueue):
+    def __init__(self, queue_file, clock=time.time):
+        self.queue_file = queue_file
+        self.clock = clock
+        try:
+            with self.connect() as connection:
+                connection.execute("""
+                    CREATE TABLE IF NOT EXISTS feeds (
+                        url TEXT PRIMARY KEY,
+                        due_at REAL NOT NULL,
+                        lease_owner TEXT,
+                        lease_expires REAL,
+                        last_polled REAL
+                    )
+                """)
+        except sqlite3.Error as e:
+            raise self.RssWorkQueueException(f"Failed to open work queue {queue_file}", e)
+
+    def connect(self):
+        # autocommit mode, transactions are started explicitly where needed
+        return closing(sqlite3.connect(self.queue_file, timeout=30, isolation_level=None))
+
+    def add(self, url):
+        logger.debug("Adding url to work queue [queue_file=%s, url=%s]", self.queue_file, url)
+        try:
+            with self.connect() as connection:
+                connection.execute("INSERT OR IGNORE INTO feeds (url, due_at) VALUES (?, ?)", (url, self.clock()))
+        except sqlite3.Error as e:
+            raise self.RssWorkQueueException(f"Failed to add {url} to work queue {self.queue_file}", e)
+
+    def lease(self, worker_id, lease_seconds):
+        now = self.clock()
+        try:
+            with self.connect() as connection:
+                # write lock is taken before select, so two workers cannot lease the same url
+                connection.execute("BEGIN IMMEDIATE")
+                try:
+                    row = connection.execute("""
+                        SELECT url FROM feeds
+                        WHERE due_at <= ? AND (lease_owner IS NULL OR lease_expires <= ?)
+                        ORDER BY due_at
+                        LIMIT 1
+                    """, (now, now)).fetchone()
+                    if row:
+                        connection.execute(
+                            "UPDATE feeds SET lease_owner = ?, lease_expires = ? WHERE url = ?",
+                            (worker_id, now + lease_seconds, row[0]),
+                        )
+                    connection.execute("COMMIT")
+                except Exception:
+                    connection.execute("ROLLBACK")
+                    raise
+        except sqlite3.Error as e:
+            raise self.RssWorkQueueException(f"Failed to lease url from work queue {self.queue_file}", e)
+        if row:
+            logger.debug("Leased url [worker_id=%s, url=%s]", worker_id, row[0])
+            return row[0]
+        return None
+
+    def complete(self, url, worker_id, interval):
+        now = self.clock()
+        try:
+            with self.connect() as connection:
+                updated = connection.execute("""
+                    UPDATE feeds SET lease_owner = NULL, lease_expires = NULL, due_at = ?, last_polled = ?
+                    WHERE url = ? AND lease_owner = ?
+                """, (now + interval, now, url, worker_id)).rowcount
+        except sqlite3.Error as e:
+            raise self.RssWorkQueueException(f"Failed to complete {url} in work queue {self.queue_file}", e)
+        if not updated:
+            logger.warning("Lease of url was lost before completion [worker_id=%s, url=%s]", worker_id, url)
+        return bool(updated)
+
+    def urls(self):
+        try:
+            with self.connect() as connection:
+                return [row[0] for row in connection.execute("SELECT url FROM feeds ORDER BY url")]
+        except sqlite3.Error as e:
+            raise self.RssWorkQueueException(f"Failed to read work queue {self.queue_file}", e)
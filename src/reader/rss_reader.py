@@ -1,20 +1,41 @@
 import argparse
+import hashlib
+import http.client
 import json
 import logging
 import os
+import random
+import socket
 import sys
 import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
 import feedparser
+from contextlib import contextmanager
 from datetime import datetime
+from glob import glob
+from urllib.parse import urlsplit
+
+try:
+    import fcntl
+except ImportError:
+    # file locking is not available on Windows, concurrent stores may reuse the same sequence there
+    fcntl = None
+
 from reader.rss_document import RssDocument, RssItem
+from reader.rss_exception import RssException
+from reader.rss_export import RssExporter
+from reader.rss_fingerprint import RssFingerprints
 from reader.rss_formatter import RssFormatter, JsonRssFormatter, TextRssFormatter, HtmlRssFormatter
+from reader.rss_host_policy import RssHostHealth, RssTokenBucket
+from reader.rss_queue import RssWorkQueue, SqliteRssWorkQueue
+from reader.rss_snapshot import RssSnapshot
+from reader.rss_websub import RssWebSubSubscriber
 from version import __version__
 
 
-class RssException(Exception):
-    pass
-
-
 class RssReaderOptionsParser(argparse.ArgumentParser):
     def __init__(self):
         super().__init__(
@@ -66,6 +87,141 @@ class RssReaderOptionsParser(argparse.ArgumentParser):
             action='append',
             dest="html",
         )
+        group2.add_argument(
+            '--queue',
+            metavar='FILE',
+            help='work queue file shared by workers on local filesystem. When url is specified, url is added to '
+                 'the queue. Since version 5.0',
+            default=None,
+        )
+        group2.add_argument(
+            '--worker',
+            action='store_true',
+            help='poll feeds from work queue specified by --queue and store them in cache. Since version 5.0',
+        )
+        group2.add_argument(
+            '--interval',
+            metavar='SECONDS',
+            help='polling interval of each feed in worker mode. Since version 5.0',
+            type=int,
+            default=600,
+        )
+        group2.add_argument(
+            '--cache-dir',
+            metavar='DIR',
+            help='directory of feed caches shared by workers. Since version 5.0',
+            default=tempfile.gettempdir(),
+        )
+        group2.add_argument(
+            '--export',
+            metavar='DIR',
+            help='export cached feeds from --cache-dir to compressed files in directory DIR. Since version 5.0',
+            default=None,
+        )
+        group2.add_argument(
+            '--export-format',
+            help='format of exported files. Since version 5.0',
+            choices=RssExporter.FORMATS,
+            default='jsonl',
+        )
+        group2.add_argument(
+            '--export-feed',
+            metavar='URL',
+            help='export only feed URL. Argument can be specified multiple times. Since version 5.0',
+            action='append',
+        )
+        group2.add_argument(
+            '--compression',
+            help='compression of exported files. Since version 5.0',
+            choices=RssExporter.COMPRESSIONS,
+            default='gzip',
+        )
+        group2.add_argument(
+            '--chunk-by',
+            help='split exported files by published day or by size only. Since version 5.0',
+            choices=RssExporter.CHUNK_BY,
+            default='day',
+        )
+        group2.add_argument(
+            '--chunk-size',
+            metavar='ITEMS',
+            help='maximal number of items in exported file. Since version 5.0',
+            type=int,
+            default=100000,
+        )
+        group2.add_argument(
+            '--chunk-bytes',
+            metavar='BYTES',
+            help='maximal size of exported file before compression. Since version 5.0',
+            type=int,
+            default=None,
+        )
+        group2.add_argument(
+            '--columns',
+            metavar='COLUMNS',
+            help=f'comma separated columns to be exported, some of {",".join(RssExporter.COLUMNS)}. Since version 5.0',
+            default=",".join(RssExporter.COLUMNS),
+        )
+        group2.add_argument(
+            '--date-from',
+            metavar='DATE',
+            help='export items published since DATE in YYYYMMDD format. Since version 5.0',
+            default=None,
+        )
+        group2.add_argument(
+            '--date-to',
+            metavar='DATE',
+            help='export items published until DATE (inclusive) in YYYYMMDD format. Since version 5.0',
+            default=None,
+        )
+        group2.add_argument(
+            '--timeout',
+            metavar='SECONDS',
+            help='timeout of feed download. Since version 5.0',
+            type=float,
+            default=30,
+        )
+        group2.add_argument(
+            '--rate',
+            metavar='REQUESTS',
+            help='maximal number of requests per second to single host, shared by all processes using the same '
+                 '--health-file. Since version 5.0',
+            type=float,
+            default=1.0,
+        )
+        group2.add_argument(
+            '--health-file',
+            metavar='FILE',
+            help='file with health of hosts, hosts failing repeatedly are skipped for a while. Since version 5.0',
+            default=tempfile.gettempdir() + os.path.sep + "rss-reader.health",
+        )
+        group2.add_argument(
+            '--websub',
+            metavar='CALLBACK_URL',
+            help='subscribe feeds at their WebSub hubs with callback CALLBACK_URL and store pushed feeds in cache. '
+                 'Feeds without hub are polled. Since version 5.0',
+            default=None,
+        )
+        group2.add_argument(
+            '--websub-port',
+            metavar='PORT',
+            help='port of WebSub callback endpoint, port of CALLBACK_URL by default. Since version 5.0',
+            type=int,
+            default=None,
+        )
+        group2.add_argument(
+            '--websub-file',
+            metavar='FILE',
+            help='file with WebSub subscriptions. Since version 5.0',
+            default=tempfile.gettempdir() + os.path.sep + "rss-reader.websub",
+        )
+        group2.add_argument(
+            '--snapshot',
+            metavar='FILE',
+            help='with --date, show items of all feeds in --cache-dir using index snapshot FILE, which is rebuilt '
+                 'when caches change. Since version 5.0',
+            default=None,
+        )
         group2.add_argument(
             'url',
             help='RSS url to be used',
@@ -85,17 +241,91 @@ class RssReaderOptionsParser(argparse.ArgumentParser):
 
 
 class RssDownloader:
+    """
+    Downloads feeds with per-host rate limit, retries with exponential backoff and jitter
+    and circuit breaker skipping hosts which are failing repeatedly
+    """
+    RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+
+    class RssDownloadAndParseFailedException(RssException):
+        pass
+
+    def __init__(self,
+                 timeout=30,
+                 retries=3,
+                 backoff=1.0,
+                 max_backoff=30,
+                 rate=1.0,
+                 burst=5,
+                 health: RssHostHealth = None,
+                 sleep=time.sleep):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.rate = rate
+        self.burst = burst
+        self.health = health or RssHostHealth()
+        self.sleep = sleep
+        self.buckets = {}
+        self.logger = logging.getLogger("RssDownloader")
+
     def download(self, url) -> RssDocument:
-        class RssDownloadAndParseFailedException(RssException):
-            pass
+        return self.parse(*self.fetch_raw(url))
 
+    def parse(self, body: bytes, headers: dict) -> RssDocument:
         try:
-            downloaded_document = feedparser.parse(url)
+            downloaded_document = feedparser.parse(body, response_headers=headers)
+            if headers.get('last-modified'):
+                # same as feedparser does when downloading url itself
+                downloaded_document['modified'] = headers['last-modified']
             if downloaded_document.bozo:
                 raise downloaded_document.bozo_exception
             return RssDocument.parse(downloaded_document)
         except Exception as e:
-            raise RssDownloadAndParseFailedException("Failed to download url / parse document", e)
+            raise self.RssDownloadAndParseFailedException("Failed to download url / parse document", e)
+
+    def fetch_raw(self, url) -> (bytes, dict):
+        """
+        Returns body and lower-cased headers of response
+        """
+        try:
+            return self.fetch(url)
+        except Exception as e:
+            raise self.RssDownloadAndParseFailedException("Failed to download url / parse document", e)
+
+    def fetch(self, url) -> (bytes, dict):
+        scheme, host = urlsplit(url)[:2]
+        if scheme not in ('http', 'https'):
+            # local files are read directly, there is no host to be protected
+            if scheme == 'file':
+                with urllib.request.urlopen(url) as response:
+                    return response.read(), {}
+            with open(url, "rb") as file:
+                return file.read(), {}
+        self.health.check(host)
+        bucket = self.buckets.setdefault(host, RssTokenBucket(self.rate, self.burst, sleep=self.sleep))
+        request = urllib.request.Request(url, headers={'User-Agent': feedparser.USER_AGENT})
+        for attempt in range(self.retries + 1):
+            self.health.acquire(host, bucket)
+            try:
+                with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                    body = response.read()
+                    headers = {k.lower(): v for k, v in response.headers.items()}
+                self.health.success(host)
+                return body, headers
+            except urllib.error.HTTPError as e:
+                if e.code not in self.RETRYABLE_STATUSES:
+                    raise
+                error = e
+            except (urllib.error.URLError, http.client.HTTPException, OSError) as e:
+                error = e
+            if attempt < self.retries:
+                delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+                self.logger.debug("Download of %s failed (%s), retrying in %.3fs", url, error, delay)
+                self.sleep(delay)
+        self.health.failure(host)
+        raise error
 
 
 class RssCache:
@@ -104,35 +334,254 @@ class RssCache:
 
     def __init__(self, cache_file=tempfile.gettempdir() + os.path.sep + "rss-reader.cache"):
         self.cache_file = cache_file
+        self.fingerprints_file = cache_file + ".fingerprints"
         self.logger = logging.getLogger("RssCache")
 
+    @staticmethod
+    def for_feed(url, cache_dir=tempfile.gettempdir()):
+        """
+        Returns cache of single feed, used when multiple feeds share the same cache directory
+        """
+        digest = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        return RssCache(cache_dir + os.path.sep + f"rss-reader.{digest}.cache")
+
+    @staticmethod
+    def all(cache_dir=tempfile.gettempdir()):
+        """
+        Returns all caches stored in cache_dir
+        """
+        return [RssCache(file) for file in sorted(glob(cache_dir + os.path.sep + "rss-reader*.cache"))]
+
+    @staticmethod
+    def sequence_file(cache_dir=tempfile.gettempdir()):
+        return cache_dir + os.path.sep + "rss-reader.sequence"
+
+    @staticmethod
+    def read_sequence(sequence_file):
+        try:
+            with open(sequence_file, "r") as file:
+                return int(file.read())
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def sequence(cache_dir=tempfile.gettempdir()):
+        """
+        Returns store sequence of caches in cache_dir, which is increased whenever any cache is stored
+        """
+        return RssCache.read_sequence(RssCache.sequence_file(cache_dir)) or 0
+
+    def next_sequence(self):
+        """
+        Increases store sequence of directory of cache and returns it
+        """
+        sequence_file = self.sequence_file(os.path.dirname(os.path.abspath(self.cache_file)))
+        with open(sequence_file + ".lock", "a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            sequence = (self.read_sequence(sequence_file) or 0) + 1
+            temp_file = f"{sequence_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_file, "w") as file:
+                file.write(str(sequence))
+            os.replace(temp_file, sequence_file)
+        return sequence
+
+    def metadata(self):
+        """
+        Returns polling metadata of feed stored in cache. Sequence is the one of the latest store, which may not be
+        finished yet, see load_stored()
+        """
+        fingerprints = self.fingerprints()
+        return {
+            'cache_file': self.cache_file,
+            'url': fingerprints.state.get('url'),
+            'body': fingerprints.state.get('body'),
+            'stored': os.path.getmtime(self.cache_file),
+            'sequence': self.read_sequence(self.cache_file + ".sequence"),
+        }
+
+    def fingerprints(self):
+        return RssFingerprints(self.fingerprints_file)
+
+    def update(self, url, downloader: RssDownloader, load=True) -> RssDocument:
+        """
+        Downloads url and stores it in cache. When neither body nor parsed document (feed and item fields stored
+        in cache) changed since last update, document is not parsed resp. stored and cached document is returned,
+        or None when load is False
+        """
+        fingerprints = self.fingerprints()
+        body, headers = downloader.fetch_raw(url)
+        document = None
+        same_body = fingerprints.same_body(url, body)
+        unchanged = same_body
+        if not same_body:
+            document = downloader.parse(body, headers)
+            unchanged = fingerprints.same_document(url, document)
+        if unchanged:
+            try:
+                if load:
+                    cached = self.load()
+                elif os.path.exists(self.cache_file):
+                    cached = None
+                else:
+                    raise self.RssCacheException(f"Cache {self.cache_file} does not exist")
+                self.logger.debug("Feed not changed, using cached document [url=%s]", url)
+                if not same_body:
+                    fingerprints.update(url, body)
+                    fingerprints.save()
+                return cached
+            except self.RssCacheException as e:
+                self.logger.warning("Failed to use cached document, storing downloaded one", exc_info=e)
+                document = document or downloader.parse(body, headers)
+        self.store(document)
+        fingerprints = self.fingerprints()
+        fingerprints.update(url, body, document)
+        fingerprints.save()
+        return document
+
+    @contextmanager
+    def locked(self):
+        """
+        Serializes stores of cache by threads and processes
+        """
+        with open(self.cache_file + ".lock", "a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
     def store(self, document: RssDocument):
+        with self.locked():
+            self.write(document)
+
+    def merge(self, document: RssDocument) -> RssDocument:
+        """
+        Stores items of document together with cached items which are not in document (identified by link),
+        used for documents containing only new or changed items. Returns stored document
+        """
+        def key(item: RssItem):
+            return item.link or (item.title, item.published_date)
+
+        with self.locked():
+            try:
+                cached = self.load()
+            except self.RssCacheException as e:
+                self.logger.debug("Nothing to merge with: %s", e)
+                cached = RssDocument(document.title, document.updated, [])
+            keys = {key(i) for i in document.items}
+            merged = RssDocument(
+                title=document.title,
+                updated=document.updated,
+                items=document.items + [i for i in cached.items if key(i) not in keys],
+                hub=document.hub,
+                self_link=document.self_link,
+            )
+            self.write(merged)
+        return merged
+
+    def write(self, document: RssDocument):
         self.logger.debug("Storing document to cache [cache_file=%s, document=%s]", self.cache_file, document)
         try:
-            with open(self.cache_file, "w") as file:
-                file.write(JsonRssFormatter().format(document))
+            # fingerprints are valid only for previously stored document
+            if os.path.exists(self.fingerprints_file):
+                os.remove(self.fingerprints_file)
+            # cache can be shared by multiple processes, readers should never see partially written file
+            # sequence is stored with document, so its readers can tell which store they loaded
+            sequence = self.next_sequence()
+            temp_file = f"{self.cache_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_file, "w") as file:
+                json.dump({'sequence': sequence, **JsonRssFormatter.format_dict(document)}, file, indent=2)
+            os.replace(temp_file, self.cache_file)
+            with open(temp_file, "w") as file:
+                file.write(str(sequence))
+            os.replace(temp_file, self.cache_file + ".sequence")
         except Exception as e:
             raise self.RssCacheException(f"Failed to save cache to {self.cache_file}", e)
 
     def load(self) -> RssDocument:
+        return self.load_stored()[1]
+
+    def load_stored(self) -> (int, RssDocument):
+        """
+        Returns sequence of store (None for caches stored by previous versions) and document loaded from cache
+        """
         self.logger.debug("Loading document from cache [cache_file=%s]", self.cache_file)
         try:
             with open(self.cache_file, "r") as file:
                 content = " ".join(file.readlines())
                 document = json.loads(content)
-                return RssDocument(
+                return document.get('sequence'), RssDocument(
                     title=document['title'],
                     updated=document['updated'],
                     items=[RssItem(
                         title=item['title'],
                         link=item['link'],
                         published_date=item['published_date'],
+                        image_link=item.get('image_link'),
                     ) for item in document['items']],
                 )
         except Exception as e:
             raise self.RssCacheException(f"Failed to load cache from {self.cache_file}", e)
 
 
+class RssWorker:
+    """
+    Polls feeds leased from shared work queue and stores them into per-feed caches in cache_dir
+    """
+    RETRY_SECONDS = 60
+
+    def __init__(self,
+                 queue: RssWorkQueue,
+                 downloader: RssDownloader,
+                 cache_dir=tempfile.gettempdir(),
+                 interval=600,
+                 lease_seconds=300,
+                 worker_id=None):
+        self.queue = queue
+        self.downloader = downloader
+        self.cache_dir = cache_dir
+        self.interval = interval
+        self.lease_seconds = lease_seconds
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.logger = logging.getLogger("RssWorker")
+
+    def poll(self):
+        """
+        Polls single due feed. Returns polled url or None when no feed is due
+        """
+        url = self.queue.lease(self.worker_id, self.lease_seconds)
+        if url is None:
+            return None
+        interval = self.interval
+        try:
+            # polled document is not used by worker, so unchanged cache does not need to be decoded
+            RssCache.for_feed(url, self.cache_dir).update(url, self.downloader, load=False)
+            self.logger.debug("Feed polled [worker_id=%s, url=%s]", self.worker_id, url)
+        except RssException as e:
+            self.logger.error(f"Failed to poll feed {url}", exc_info=e)
+            interval = min(self.interval, self.RETRY_SECONDS)
+        try:
+            self.queue.complete(url, self.worker_id, interval)
+        except RssWorkQueue.RssWorkQueueException as e:
+            # lease expires and the feed is polled again, worker must keep running
+            self.logger.error(f"Failed to complete feed {url} in work queue", exc_info=e)
+        return url
+
+    def run(self, idle_sleep=1.0, max_polls=None):
+        polls = 0
+        while max_polls is None or polls < max_polls:
+            try:
+                url = self.poll()
+            except RssWorkQueue.RssWorkQueueException as e:
+                # eg. queue locked by other workers for too long, next lease is tried after a while
+                self.logger.error("Failed to lease feed from work queue", exc_info=e)
+                url = None
+            if url is None:
+                time.sleep(idle_sleep)
+            else:
+                polls += 1
+        return polls
+
+
 class RssReader:
     EXIT_CODE_OK = 0
     EXIT_CODE_ERROR = 2
@@ -146,6 +595,15 @@ class RssReader:
     def run(args=None):
         try:
             reader = RssReader(args)
+            if reader.args.websub:
+                reader.run_websub()
+                return
+            if reader.args.queue:
+                reader.run_queue()
+                return
+            if reader.args.export:
+                print("\n".join(reader.export()))
+                return
             reader.load_rss()
             print(reader.format_output())
             reader.generate_files()
@@ -156,6 +614,11 @@ class RssReader:
     def __init__(self, args=None):
         self.args = self.validate_args(args)
         self.logger.debug("Using args: %ss", self.args)
+        self.downloader = RssDownloader(
+            timeout=self.args.timeout,
+            rate=self.args.rate,
+            health=RssHostHealth(self.args.health_file),
+        )
 
     def validate_args(self, args):
         parser = RssReaderOptionsParser()
@@ -177,10 +640,35 @@ class RssReader:
             print(f"Argument 'date' should have format {date_format}, when specified")
             parser.print_usage()
             exit(self.EXIT_CODE_VALIDATION_ERROR)
-        if not args.date and not args.url:
+        for date in [args.date_from, args.date_to]:
+            if date and not (date.isdecimal() and len(date) == len(date_format)):
+                print(f"Arguments 'date-from' and 'date-to' should have format {date_format}, when specified")
+                parser.print_usage()
+                exit(self.EXIT_CODE_VALIDATION_ERROR)
+        if args.timeout <= 0 or args.rate <= 0:
+            print(f"Arguments 'timeout' and 'rate' should be positive numbers")
+            parser.print_usage()
+            exit(self.EXIT_CODE_VALIDATION_ERROR)
+        if args.chunk_size <= 0:
+            print(f"Argument 'chunk-size' should be positive number")
+            parser.print_usage()
+            exit(self.EXIT_CODE_VALIDATION_ERROR)
+        if args.websub and not args.url and not args.queue:
+            print(f"Argument 'url' or 'queue' should be present, when 'websub' is specified")
+            parser.print_usage()
+            exit(self.EXIT_CODE_VALIDATION_ERROR)
+        if not args.date and not args.url and not args.worker and not args.export and not args.websub:
             print(f"Argument 'url' should be present")
             parser.print_usage()
             exit(self.EXIT_CODE_VALIDATION_ERROR)
+        if args.worker and not args.queue:
+            print(f"Argument 'queue' should be present, when 'worker' is specified")
+            parser.print_usage()
+            exit(self.EXIT_CODE_VALIDATION_ERROR)
+        if args.interval <= 0:
+            print(f"Argument 'interval' should be positive number")
+            parser.print_usage()
+            exit(self.EXIT_CODE_VALIDATION_ERROR)
         if args.limit is not None and args.limit <= 0:
             print(f"Argument 'limit' should be positive number, when specified")
             parser.print_usage()
@@ -206,16 +694,19 @@ class RssReader:
 
     def load_rss(self):
         if self.args.url:
-            self.document = self.downloader.download(self.args.url)
-            self.cache.store(self.document)
+            self.document = self.cache.update(self.args.url, self.downloader)
         else:
             assert self.args.date  # args.date should be defined
-            self.document = self.cache.load()
             filter_date = datetime.strptime(self.args.date, "%Y%m%d")
-            items = list(filter(
-                lambda i: i.published_day() == filter_date,
-                self.document.items
-            ))
+            if self.args.snapshot:
+                self.document = self.load_from_snapshot(filter_date)
+                items = self.document.items
+            else:
+                self.document = self.cache.load()
+                items = list(filter(
+                    lambda i: i.published_day() == filter_date,
+                    self.document.items
+                ))
             if len(items) == 0:
                 class NoRssItemFound(RssException):
                     pass
@@ -225,6 +716,116 @@ class RssReader:
         self.document.items = self.document.items[:self.args.limit]
         return self.document
 
+    def load_from_snapshot(self, day):
+        def list_feeds():
+            for cache in RssCache.all(self.args.cache_dir):
+                try:
+                    yield cache.metadata()
+                except OSError as e:
+                    self.logger.warning("Cache %s is not included in snapshot", cache.cache_file, exc_info=e)
+
+        def load_feed(metadata):
+            sequence, document = RssCache(metadata['cache_file']).load_stored()
+            return {**metadata, 'sequence': sequence}, document
+
+        # cache stored after snapshot was built is found changed, snapshot is then rebuilt and read again once
+        for attempt in range(2):
+            snapshot = RssSnapshot.open_or_rebuild(self.args.snapshot, RssCache.sequence(self.args.cache_dir),
+                                                   list_feeds, load_feed, rebuild=attempt > 0)
+            try:
+                positions = {}
+                for feed, position in snapshot.items_on(day):
+                    positions.setdefault(feed, []).append(position)
+                documents = []
+                items = []
+                changed = []
+                for feed, feed_positions in positions.items():
+                    metadata = snapshot.feeds[feed]
+                    try:
+                        sequence, document = RssCache(metadata['cache_file']).load_stored()
+                    except RssCache.RssCacheException as e:
+                        self.logger.debug("Cache indexed by snapshot is not available: %s", e)
+                        sequence, document = None, None
+                    # positions are valid only in the stored document they were indexed from
+                    if document is None or sequence != metadata.get('sequence') \
+                            or max(feed_positions) >= len(document.items):
+                        changed.append(metadata['cache_file'])
+                        continue
+                    documents.append(document)
+                    items.extend(document.items[position] for position in feed_positions)
+            finally:
+                snapshot.close()
+            if not changed:
+                break
+            self.logger.debug("Caches %s changed since snapshot was built, it is rebuilt", changed)
+        else:
+            self.logger.warning("Caches %s keep changing while reading snapshot, their items are skipped", changed)
+        return RssDocument(
+            title=", ".join(dict.fromkeys(d.title for d in documents)),
+            updated=max([d.updated for d in documents], default=""),
+            items=items,
+        )
+
+    def run_queue(self):
+        queue = SqliteRssWorkQueue(self.args.queue)
+        if self.args.url:
+            queue.add(self.args.url)
+            print(f"Feed {self.args.url} added to queue {self.args.queue}")
+        if self.args.worker:
+            RssWorker(
+                queue=queue,
+                downloader=self.downloader,
+                cache_dir=self.args.cache_dir,
+                interval=self.args.interval,
+            ).run()
+
+    def run_websub(self):
+        def store(url, document):
+            RssCache.for_feed(url, self.args.cache_dir).store(document)
+
+        def merge(url, document):
+            RssCache.for_feed(url, self.args.cache_dir).merge(document)
+
+        subscriber = RssWebSubSubscriber(
+            callback_url=self.args.websub,
+            on_document=store,
+            on_push=merge,
+            subscriptions_file=self.args.websub_file,
+            timeout=self.args.timeout,
+        )
+        server = subscriber.serve(port=self.args.websub_port or urlsplit(self.args.websub).port or 80)
+        try:
+            while True:
+                urls = SqliteRssWorkQueue(self.args.queue).urls() if self.args.queue else [self.args.url]
+                subscriber.poll(urls, self.downloader)
+                time.sleep(self.args.interval)
+        finally:
+            server.shutdown()
+
+    def export(self):
+        if self.args.export_feed:
+            caches = [RssCache.for_feed(url, self.args.cache_dir) for url in self.args.export_feed]
+        else:
+            caches = RssCache.all(self.args.cache_dir)
+
+        def parse_date(date):
+            return datetime.strptime(date, "%Y%m%d") if date else None
+
+        exporter = RssExporter(
+            output_dir=self.args.export,
+            export_format=self.args.export_format,
+            compression=self.args.compression,
+            columns=[c.strip() for c in self.args.columns.split(",")],
+            chunk_by=self.args.chunk_by,
+            chunk_size=self.args.chunk_size,
+            chunk_bytes=self.args.chunk_bytes,
+        )
+        return exporter.export(
+            (cache.load() for cache in caches),
+            date_from=parse_date(self.args.date_from),
+            date_to=parse_date(self.args.date_to),
+        )
+
     def format_output(self):
         formatter: RssFormatter = JsonRssFormatter() if self.args.json else TextRssFormatter()
         return formatter.format(self.document)
@@ -233,16 +834,26 @@ class RssReader:
         failures = []
         generated = []
         if self.args.html:
-            html = HtmlRssFormatter().format(self.document)
+            fingerprints = self.cache.fingerprints()
+            html = None
+            changed = False
             for file in self.args.html:
                 try:
-                    with open(file, "w") as f:
-                        f.write(html)
+                    if os.path.exists(file) and fingerprints.same_output(file, self.document):
+                        self.logger.debug("File %s is up to date", file)
+                    else:
+                        html = html or HtmlRssFormatter().format(self.document)
+                        with open(file, "w") as f:
+                            f.write(html)
+                        fingerprints.update_output(file, self.document)
+                        changed = True
+                        self.logger.debug("File %s was generated", file)
                     generated.append(file)
-                    self.logger.debug("File %s was generated", file)
                 except Exception as e:
                     self.logger.error(f"Failed to generate file {file}", exc_info=e)
                     failures.append((file, e))
+            if changed:
+                fingerprints.save()
         if failures:
             class RssDocumentGenerationException(RssException):
                 pass
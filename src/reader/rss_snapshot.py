@@ -0,0 +1,211 @@
+import json
+import logging
+import mmap
+import os
+import struct
+from datetime import datetime
+
+from reader.rss_document import RssDocument
+from reader.rss_exception import RssException
+
+logger = logging.getLogger(__file__)
+
+
+class RssSnapshotException(RssException):
+    pass
+
+
+class RssSnapshot:
+    """
+    Memory-mapped snapshot of date index and metadata of cached feeds.
+
+    File layout (little endian):
+      header   magic, version, store sequence, feed count, day count, item count
+      days     day count x (day ordinal, first item, item count), sorted by day
+      items    item count x (feed, position in feed), grouped by day
+      feeds    length and utf-8 json list of feed metadata
+    """
+    MAGIC = b'RSSN'
+    VERSION = 2
+    HEADER = struct.Struct('<4sHHQIII')
+    DAY = struct.Struct('<iII')
+    ITEM = struct.Struct('<II')
+    LENGTH = struct.Struct('<I')
+    NO_DAY = 0
+
+    def __init__(self, buffer, file=None):
+        self.buffer = buffer
+        self.file = file
+        magic, version, _, self.sequence, self.feed_count, self.day_count, self.item_count = \
+            self.HEADER.unpack_from(buffer, 0)
+        if magic != self.MAGIC or version != self.VERSION:
+            raise RssSnapshotException(f"Unsupported snapshot [magic={magic}, version={version}]")
+        self.days_offset = self.HEADER.size
+        self.items_offset = self.days_offset + self.day_count * self.DAY.size
+        feeds_offset = self.items_offset + self.item_count * self.ITEM.size
+        (length,) = self.LENGTH.unpack_from(buffer, feeds_offset)
+        start = feeds_offset + self.LENGTH.size
+        if start + length != len(buffer):
+            raise RssSnapshotException("Snapshot is truncated")
+        self.feeds = json.loads(bytes(buffer[start:start + length]).decode("utf-8"))
+
+    @classmethod
+    def item_days(cls, document: RssDocument):
+        """
+        Returns day ordinals of items of document by their position
+        """
+        days = []
+        for item in document.items:
+            try:
+                days.append(item.published_day().toordinal())
+            except (TypeError, ValueError):
+                days.append(cls.NO_DAY)
+        return days
+
+    @classmethod
+    def build(cls, sequence, feeds):
+        """
+        Serializes snapshot of feeds, which are pairs of feed metadata and item days (see item_days())
+        """
+        days = {}
+        metadata = []
+        for feed, (meta, item_days) in enumerate(feeds):
+            metadata.append(meta)
+            for position, day in enumerate(item_days):
+                days.setdefault(day, []).append((feed, position))
+        items = []
+        day_table = []
+        for day in sorted(days):
+            day_table.append(cls.DAY.pack(day, len(items), len(days[day])))
+            items.extend(days[day])
+        feeds_json = json.dumps(metadata, separators=(',', ':')).encode("utf-8")
+        return b"".join([
+            cls.HEADER.pack(cls.MAGIC, cls.VERSION, 0, sequence, len(metadata), len(day_table), len(items)),
+            *day_table,
+            *[cls.ITEM.pack(*item) for item in items],
+            cls.LENGTH.pack(len(feeds_json)),
+            feeds_json,
+        ])
+
+    @classmethod
+    def write(cls, snapshot_file, sequence, feeds):
+        data = cls.build(sequence, feeds)
+        try:
+            temp_file = f"{snapshot_file}.{os.getpid()}.tmp"
+            with open(temp_file, "wb") as file:
+                file.write(data)
+            os.replace(temp_file, snapshot_file)
+        except OSError as e:
+            raise RssSnapshotException(f"Failed to write snapshot {snapshot_file}", e)
+        logger.debug("Snapshot written [file=%s, sequence=%s, bytes=%s]", snapshot_file, sequence, len(data))
+
+    @classmethod
+    def open(cls, snapshot_file, sequence=None):
+        """
+        Maps snapshot into memory. Returns None when snapshot is missing, broken or its sequence does not match
+        (when specified)
+        """
+        try:
+            with open(snapshot_file, "rb") as file:
+                buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as e:
+            logger.debug("Snapshot %s not available: %s", snapshot_file, e)
+            return None
+        try:
+            snapshot = RssSnapshot(buffer, snapshot_file)
+        except (RssSnapshotException, struct.error, ValueError) as e:
+            logger.warning("Snapshot %s is broken, it will be rebuilt", snapshot_file, exc_info=e)
+            buffer.close()
+            return None
+        if sequence is not None and snapshot.sequence != sequence:
+            logger.debug("Snapshot %s is outdated [sequence=%s, expected=%s]", snapshot_file, snapshot.sequence,
+                         sequence)
+            snapshot.close()
+            return None
+        return snapshot
+
+    @classmethod
+    def open_or_rebuild(cls, snapshot_file, sequence, list_feeds, load_feed, rebuild=False):
+        """
+        Opens snapshot matching sequence, or rebuilds it (always when rebuild is True) from metadata of current feeds
+        returned by list_feeds(). Feed is identified by its 'cache_file', items of feeds with the same 'sequence'
+        as in previous snapshot are reused, other feeds are loaded by load_feed(metadata) returning metadata
+        of loaded version of the feed and RssDocument
+        """
+        previous = cls.open(snapshot_file)
+        if previous is not None and previous.sequence == sequence and not rebuild:
+            return previous
+        try:
+            reused = {}
+            if previous is not None:
+                feed_days = previous.feed_days()
+                reused = {meta['cache_file']: (meta, feed_days.get(feed, []))
+                          for feed, meta in enumerate(previous.feeds)}
+            feeds = []
+            loaded = 0
+            for meta in list_feeds():
+                previous_meta, item_days = reused.get(meta['cache_file'], (None, None))
+                if not cls.same_version(previous_meta, meta):
+                    try:
+                        meta, document = load_feed(meta)
+                        item_days = cls.item_days(document)
+                        loaded += 1
+                    except (RssException, OSError) as e:
+                        logger.warning("Feed %s is not included in snapshot", meta['cache_file'], exc_info=e)
+                        continue
+                feeds.append((meta, item_days))
+        finally:
+            if previous is not None:
+                previous.close()
+        logger.debug("Rebuilding snapshot [file=%s, feeds=%s, loaded=%s]", snapshot_file, len(feeds), loaded)
+        cls.write(snapshot_file, sequence, feeds)
+        snapshot = cls.open(snapshot_file, sequence)
+        if snapshot is None:
+            raise RssSnapshotException(f"Failed to open rebuilt snapshot {snapshot_file}")
+        return snapshot
+
+    @staticmethod
+    def same_version(meta, other_meta):
+        """
+        Returns True when both metadata describe the same stored content of feed
+        """
+        return meta is not None and other_meta is not None \
+            and meta.get('sequence') is not None and meta['sequence'] == other_meta.get('sequence')
+
+    def close(self):
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
+
+    def feed_days(self):
+        """
+        Returns item days (see item_days()) of every feed
+        """
+        result = {}
+        for d in range(self.day_count):
+            day, first, count = self.DAY.unpack_from(self.buffer, self.days_offset + d * self.DAY.size)
+            for i in range(first, first + count):
+                feed, position = self.ITEM.unpack_from(self.buffer, self.items_offset + i * self.ITEM.size)
+                days = result.setdefault(feed, [])
+                days.extend([self.NO_DAY] * (position + 1 - len(days)))
+                days[position] = day
+        return result
+
+    def items_on(self, day: datetime):
+        """
+        Returns (feed, position) of items published on day
+        """
+        ordinal = day.toordinal()
+        low, high = 0, self.day_count
+        while low < high:
+            middle = (low + high) // 2
+            if self.DAY.unpack_from(self.buffer, self.days_offset + middle * self.DAY.size)[0] < ordinal:
+                low = middle + 1
+            else:
+                high = middle
+        if low == self.day_count:
+            return []
+        found, first, count = self.DAY.unpack_from(self.buffer, self.days_offset + low * self.DAY.size)
+        if found != ordinal:
+            return []
+        return [self.ITEM.unpack_from(self.buffer, self.items_offset + i * self.ITEM.size)
+                for i in range(first, first + count)]
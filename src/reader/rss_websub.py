@@ -0,0 +1,267 @@
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import feedparser
+
+from reader.rss_document import RssDocument
+from reader.rss_exception import RssException
+
+logger = logging.getLogger(__file__)
+
+
+class RssWebSubException(RssException):
+    pass
+
+
+class RssWebSubSubscriber:
+    """
+    WebSub (PubSubHubbub) subscriber. Feeds advertising hub are subscribed and documents pushed by the hub are passed
+    to on_push(url, document), on_document by default. Hub may push only new or changed items, so on_push should
+    merge them with previously received ones. Feeds without hub or without active subscription are polled instead
+    and polled documents are passed to on_document(url, document).
+    Subscriptions are persisted in subscriptions_file, so they survive restarts.
+    Every subscription has random callback token, so callbacks of other parties cannot be guessed, and verification
+    of intent is accepted only for subscription request sent by this subscriber.
+    """
+    PENDING_TIMEOUT = 600
+    MAX_LEASE_SECONDS = 30 * 86400
+    SIGNATURE_METHODS = {
+        'sha1': hashlib.sha1,
+        'sha256': hashlib.sha256,
+        'sha384': hashlib.sha384,
+        'sha512': hashlib.sha512,
+    }
+
+    def __init__(self, callback_url, on_document, subscriptions_file=None, lease_seconds=86400, timeout=30,
+                 clock=time.time, on_push=None):
+        self.callback_url = callback_url.rstrip("/")
+        self.on_document = on_document
+        self.on_push = on_push or on_document
+        self.subscriptions_file = subscriptions_file
+        self.lease_seconds = lease_seconds
+        self.timeout = timeout
+        self.clock = clock
+        self.lock = threading.RLock()
+        self.subscriptions = self.load()
+
+    def by_token(self, token):
+        for subscription in self.subscriptions.values():
+            if token and hmac.compare_digest(subscription.get('token', ''), token):
+                return subscription
+        return None
+
+    def load(self):
+        if not self.subscriptions_file or not os.path.exists(self.subscriptions_file):
+            return {}
+        try:
+            with open(self.subscriptions_file, "r") as file:
+                return json.load(file)
+        except (OSError, ValueError) as e:
+            logger.warning("Failed to load subscriptions from %s", self.subscriptions_file, exc_info=e)
+            return {}
+
+    def save(self):
+        if not self.subscriptions_file:
+            return
+        try:
+            temp_file = f"{self.subscriptions_file}.{os.getpid()}.tmp"
+            with open(temp_file, "w") as file:
+                json.dump(self.subscriptions, file)
+            os.replace(temp_file, self.subscriptions_file)
+        except OSError as e:
+            logger.warning("Failed to save subscriptions to %s", self.subscriptions_file, exc_info=e)
+
+    def is_active(self, url):
+        subscription = self.subscriptions.get(url)
+        return bool(subscription) and subscription['state'] == 'active' and subscription['expires'] > self.clock()
+
+    def is_pending(self, url):
+        subscription = self.subscriptions.get(url)
+        return bool(subscription) and subscription['state'] == 'pending' and self.awaiting_verification(subscription)
+
+    def awaiting_verification(self, subscription):
+        return subscription.get('requested') is not None \
+            and subscription['requested'] + self.PENDING_TIMEOUT > self.clock()
+
+    def subscribe(self, url, hub, topic=None):
+        """
+        Sends subscription request for url to hub. Subscription becomes active once hub verifies it
+        """
+        with self.lock:
+            subscription = self.subscriptions.get(url, {'state': 'pending', 'expires': 0})
+            subscription.update({
+                'url': url,
+                'hub': hub,
+                'topic': topic or url,
+                'secret': subscription.get('secret') or secrets.token_hex(32),
+                'token': subscription.get('token') or secrets.token_urlsafe(32),
+                'requested': self.clock(),
+            })
+            if subscription['state'] != 'active':
+                subscription['state'] = 'pending'
+            self.subscriptions[url] = subscription
+            self.save()
+        data = urllib.parse.urlencode({
+            'hub.mode': 'subscribe',
+            'hub.topic': subscription['topic'],
+            'hub.callback': f"{self.callback_url}/{subscription['token']}",
+            'hub.secret': subscription['secret'],
+            'hub.lease_seconds': self.lease_seconds,
+        }).encode("utf-8")
+        logger.debug("Subscribing [url=%s, hub=%s, topic=%s]", url, hub, subscription['topic'])
+        try:
+            with urllib.request.urlopen(hub, data=data, timeout=self.timeout):
+                pass
+        except (urllib.error.URLError, OSError) as e:
+            raise RssWebSubException(f"Failed to subscribe {url} at hub {hub}", e)
+
+    def renew(self):
+        """
+        Renews active subscriptions expiring within last tenth of their lease
+        """
+        now = self.clock()
+        for subscription in list(self.subscriptions.values()):
+            if subscription['state'] == 'active' and not self.awaiting_verification(subscription) and \
+                    subscription['expires'] - now <= subscription.get('lease_seconds', self.lease_seconds) / 10:
+                try:
+                    self.subscribe(subscription['url'], subscription['hub'], subscription['topic'])
+                except RssWebSubException as e:
+                    logger.error("Failed to renew subscription of %s", subscription['url'], exc_info=e)
+
+    def poll(self, urls, downloader):
+        """
+        Polls feeds which have no active subscription and subscribes feeds advertising hub.
+        Returns polled urls
+        """
+        self.renew()
+        polled = []
+        for url in urls:
+            if self.is_active(url):
+                continue
+            try:
+                document = downloader.download(url)
+                self.on_document(url, document)
+                polled.append(url)
+                if document.hub and not self.is_pending(url):
+                    self.subscribe(url, document.hub, document.self_link)
+            except RssException as e:
+                logger.error("Failed to poll feed %s", url, exc_info=e)
+        return polled
+
+    def verify(self, token, params):
+        """
+        Handles verification of intent from hub. Returns challenge to be echoed or None when request is not confirmed.
+        Raises RssWebSubException when request is invalid
+        """
+        mode = params.get('hub.mode')
+        with self.lock:
+            subscription = self.by_token(token)
+            if not subscription or params.get('hub.topic') != subscription['topic']:
+                return None
+            if mode == 'subscribe':
+                # only subscription (or its renewal) requested by us and not verified yet can be confirmed
+                if not self.awaiting_verification(subscription):
+                    return None
+                try:
+                    lease_seconds = int(params.get('hub.lease_seconds', self.lease_seconds))
+                except ValueError:
+                    raise RssWebSubException(f"Invalid lease {params.get('hub.lease_seconds')}")
+                if lease_seconds <= 0:
+                    raise RssWebSubException(f"Invalid lease {lease_seconds}")
+                lease_seconds = min(lease_seconds, self.MAX_LEASE_SECONDS)
+                subscription.update({
+                    'state': 'active',
+                    'lease_seconds': lease_seconds,
+                    'expires': self.clock() + lease_seconds,
+                    'requested': None,
+                })
+            elif mode == 'denied':
+                # denial is sent by hub to secret callback only, polling is used again
+                del self.subscriptions[subscription['url']]
+            else:
+                # we never unsubscribe, so unsubscription cannot be confirmed
+                return None
+            self.save()
+        logger.debug("Subscription verified [mode=%s, url=%s]", mode, subscription['url'])
+        return params.get('hub.challenge', '')
+
+    def notify(self, token, body, signature):
+        """
+        Handles content distributed by hub. Returns False when content was ignored
+        """
+        subscription = self.by_token(token)
+        if not subscription:
+            return False
+        method, _, digest = (signature or '').partition('=')
+        if method not in self.SIGNATURE_METHODS:
+            logger.warning("Content of %s ignored, unsupported signature %s", subscription['url'], signature)
+            return False
+        expected = hmac.new(subscription['secret'].encode("utf-8"), body, self.SIGNATURE_METHODS[method]).hexdigest()
+        if not hmac.compare_digest(expected, digest):
+            logger.warning("Content of %s ignored, signature does not match", subscription['url'])
+            return False
+        try:
+            downloaded_document = feedparser.parse(body)
+            if downloaded_document.bozo:
+                raise downloaded_document.bozo_exception
+            self.on_push(subscription['url'], RssDocument.parse(downloaded_document))
+        except Exception as e:
+            logger.error("Failed to process content of %s", subscription['url'], exc_info=e)
+            return False
+        return True
+
+    def serve(self, host="", port=8080):
+        """
+        Starts callback endpoint in background thread. Returns server, which should be stopped by shutdown()
+        """
+        subscriber = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def token(self):
+                return urllib.parse.urlsplit(self.path).path.rstrip("/").rsplit("/", 1)[-1]
+
+            def do_GET(self):
+                params = dict(urllib.parse.parse_qsl(urllib.parse.urlsplit(self.path).query))
+                try:
+                    challenge = subscriber.verify(self.token(), params)
+                except RssWebSubException as e:
+                    logger.warning("Invalid verification request %s", self.path, exc_info=e)
+                    self.send_response(400)
+                    self.end_headers()
+                    return
+                if challenge is None:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain")
+                self.end_headers()
+                self.wfile.write(challenge.encode("utf-8"))
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                known = subscriber.notify(self.token(), body, self.headers.get('X-Hub-Signature'))
+                # hub should not retry distribution of content we rejected, so 2xx is returned anyway
+                self.send_response(204 if known else 202)
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                logger.debug(format, *args)
+
+        try:
+            server = ThreadingHTTPServer((host, port), Handler)
+        except OSError as e:
+            raise RssWebSubException(f"Failed to start WebSub callback endpoint on port {port}", e)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        logger.debug("WebSub callback endpoint started on port %s", server.server_port)
+        return server
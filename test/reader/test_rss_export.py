@@ -0,0 +1,134 @@
+import csv
+import gzip
+import io
+import json
+import os
+import tempfile
+import time
+import unittest
+from datetime import datetime
+
+from reader.rss_document import RssDocument, RssItem
+from reader.rss_exception import RssException
+from reader.rss_export import RssExporter
+from reader.rss_reader import RssReader, RssCache
+
+DOCUMENTS = [
+    RssDocument("feed1", "updated", [
+        RssItem("title1", "link1", "2022-01-01T01:02:03Z", "image1"),
+        RssItem("title2", "link2", "2022-01-02T01:02:03Z"),
+    ]),
+    RssDocument("feed2", "updated", [
+        RssItem("title3", "link3", "2022-01-01T10:00:00Z"),
+        RssItem("title4", "link4", "2022-01-03T10:00:00Z"),
+    ]),
+]
+
+
+def read(file):
+    with gzip.open(file, "rt") as f:
+        return f.read()
+
+
+class RssExporterTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_export_jsonl_by_day(self):
+        files = RssExporter(self.directory.name).export(DOCUMENTS)
+        self.assertEqual(["rss-20220101-00001.jsonl.gz", "rss-20220102-00001.jsonl.gz", "rss-20220103-00001.jsonl.gz"],
+                         sorted(os.path.basename(f) for f in files))
+        rows = [json.loads(line) for line in read(sorted(files)[0]).splitlines()]
+        self.assertEqual([
+            {'feed': 'feed1', 'title': 'title1', 'link': 'link1', 'published_date': '2022-01-01T01:02:03Z',
+             'image_link': 'image1'},
+            {'feed': 'feed2', 'title': 'title3', 'link': 'link3', 'published_date': '2022-01-01T10:00:00Z',
+             'image_link': None},
+        ], rows)
+
+    def test_export_csv_by_size_with_columns(self):
+        files = RssExporter(self.directory.name, export_format='csv', columns=['title', 'link'], chunk_by='size',
+                            chunk_size=3).export(DOCUMENTS)
+        self.assertEqual(["rss-all-00001.csv.gz", "rss-all-00002.csv.gz"], sorted(os.path.basename(f) for f in files))
+        rows = [list(csv.reader(io.StringIO(read(f)))) for f in sorted(files)]
+        self.assertEqual([['title', 'link'], ['title1', 'link1'], ['title2', 'link2'], ['title3', 'link3']], rows[0])
+        self.assertEqual([['title', 'link'], ['title4', 'link4']], rows[1])
+
+    def test_export_columnar(self):
+        files = RssExporter(self.directory.name, export_format='columnar', columns=['title'], chunk_by='size',
+                            compression='none').export(DOCUMENTS)
+        with open(files[0]) as f:
+            self.assertEqual({'column': 'title', 'values': ['title1', 'title2', 'title3', 'title4']}, json.loads(f.read()))
+
+    def test_export_date_range(self):
+        files = RssExporter(self.directory.name, chunk_by='size').export(
+            DOCUMENTS, date_from=datetime(2022, 1, 2), date_to=datetime(2022, 1, 3))
+        titles = [json.loads(line)['title'] for line in read(files[0]).splitlines()]
+        self.assertEqual(['title2', 'title4'], titles)
+
+    def test_export_chunks_by_bytes(self):
+        documents = [RssDocument("feed", "updated", [
+            RssItem("title" * (i % 7 + 1), f"link{i}", "2022-01-01T01:02:03Z") for i in range(50)
+        ])]
+        for export_format in RssExporter.FORMATS:
+            directory = self.directory.name + os.path.sep + export_format
+            files = RssExporter(directory, export_format=export_format, compression='none', chunk_by='size',
+                                chunk_bytes=1000).export(documents)
+            self.assertGreater(len(files), 2)
+            for file in files:
+                self.assertLessEqual(os.path.getsize(file), 1000)
+            with open(sorted(files)[0]) as f:
+                self.assertGreater(len(f.read()), 500)
+
+    def test_export_with_bounded_buffers(self):
+        written = []
+
+        class TrackingExporter(RssExporter):
+            def write_chunk(self, key, part, rows):
+                written.append(len(rows))
+                return super().write_chunk(key, part, rows)
+
+        files = TrackingExporter(self.directory.name, max_buffered_rows=2).export(DOCUMENTS)
+        self.assertTrue(all(rows <= 2 for rows in written))
+        titles = sorted(json.loads(line)['title'] for f in files for line in read(f).splitlines())
+        self.assertEqual(['title1', 'title2', 'title3', 'title4'], titles)
+
+    def test_export_does_not_read_ahead_of_slow_writers(self):
+        consumed = []
+        ahead = []
+
+        def documents():
+            for day in range(1, 11):
+                consumed.append(day)
+                yield RssDocument("feed", "updated", [RssItem("title", "link", f"2022-01-{day:02d}T00:00:00Z")])
+
+        class SlowExporter(RssExporter):
+            def write_chunk(self, key, part, rows):
+                ahead.append(len(consumed) - len(ahead))
+                time.sleep(0.02)
+                return super().write_chunk(key, part, rows)
+
+        files = SlowExporter(self.directory.name, chunk_size=1, workers=1).export(documents())
+        self.assertEqual(10, len(files))
+        self.assertTrue(max(ahead) <= 2, ahead)
+
+    def test_unknown_column(self):
+        with self.assertRaises(RssException):
+            RssExporter(self.directory.name, columns=['unknown'])
+
+
+class RssReaderExportTest(unittest.TestCase):
+    def test_export_feeds_from_cache_dir(self):
+        with tempfile.TemporaryDirectory() as directory:
+            RssCache.for_feed("url1", directory).store(DOCUMENTS[0])
+            RssCache.for_feed("url2", directory).store(DOCUMENTS[1])
+            export_dir = directory + os.path.sep + "export"
+            reader = RssReader(['--cache-dir', directory, '--export', export_dir, '--export-feed', 'url1',
+                                '--chunk-by', 'size', '--columns', 'title,image_link'])
+            files = reader.export()
+            rows = [json.loads(line) for line in read(files[0]).splitlines()]
+            self.assertEqual([{'title': 'title1', 'image_link': 'image1'}, {'title': 'title2', 'image_link': None}],
+                             rows)
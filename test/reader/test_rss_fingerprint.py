@@ -0,0 +1,60 @@
+import os
+import tempfile
+import unittest
+
+from reader.rss_document import RssDocument, RssItem
+from reader.rss_fingerprint import RssFingerprints
+
+ITEMS = [
+    RssItem("title1", "link1", "2022-01-01T01:02:03Z"),
+    RssItem("title2", "link2", "2022-01-01T01:02:03Z"),
+]
+
+
+class RssFingerprintsTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.fingerprints_file = self.directory.name + os.path.sep + "fingerprints"
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_body_and_document_are_persisted(self):
+        fingerprints = RssFingerprints(self.fingerprints_file)
+        fingerprints.update("url", b"body", RssDocument("title", "updated", ITEMS))
+        fingerprints.save()
+        loaded = RssFingerprints(self.fingerprints_file)
+        self.assertTrue(loaded.same_body("url", b"body"))
+        self.assertFalse(loaded.same_body("url", b"other body"))
+        self.assertFalse(loaded.same_body("other url", b"body"))
+        self.assertTrue(loaded.same_document("url", RssDocument("title", "updated", list(ITEMS))))
+        self.assertFalse(loaded.same_document("other url", RssDocument("title", "updated", ITEMS)))
+
+    def test_same_document_compares_feed_and_item_fields(self):
+        fingerprints = RssFingerprints(self.fingerprints_file)
+        fingerprints.update("url", b"body", RssDocument("title", "updated", ITEMS))
+        image = RssItem("title1", "link1", "2022-01-01T01:02:03Z", image_link="image")
+        for document in [RssDocument("other title", "updated", ITEMS),
+                         RssDocument("title", "other updated", ITEMS),
+                         RssDocument("title", "updated", [image, ITEMS[1]]),
+                         RssDocument("title", "updated", ITEMS[:1])]:
+            self.assertFalse(fingerprints.same_document("url", document))
+
+    def test_update_keeps_document_when_not_specified(self):
+        fingerprints = RssFingerprints(self.fingerprints_file)
+        fingerprints.update("url", b"body", RssDocument("title", "updated", ITEMS))
+        fingerprints.update("url", b"other body")
+        self.assertTrue(fingerprints.same_document("url", RssDocument("title", "updated", ITEMS)))
+
+    def test_same_output(self):
+        fingerprints = RssFingerprints(self.fingerprints_file)
+        document = RssDocument("title", "updated", ITEMS)
+        fingerprints.update_output("file.html", document)
+        self.assertTrue(fingerprints.same_output("file.html", RssDocument("title", "updated", list(ITEMS))))
+        self.assertFalse(fingerprints.same_output("file.html", RssDocument("title", "updated", ITEMS[:1])))
+        self.assertFalse(fingerprints.same_output("other.html", document))
+
+    def test_broken_file_is_ignored(self):
+        with open(self.fingerprints_file, "w") as f:
+            f.write("broken")
+        self.assertFalse(RssFingerprints(self.fingerprints_file).same_body("url", b"body"))
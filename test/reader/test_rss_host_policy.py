@@ -0,0 +1,133 @@
+import os
+import tempfile
+import unittest
+
+from reader.rss_exception import RssException
+from reader.rss_host_policy import RssTokenBucket, RssHostHealth
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class RssTokenBucketTest(unittest.TestCase):
+    def test_burst_then_rate(self):
+        clock = Clock()
+        bucket = RssTokenBucket(rate=2, burst=3, clock=clock, sleep=clock.sleep)
+        for i in range(3):
+            bucket.acquire()
+        self.assertEqual(1000.0, clock.now)
+        bucket.acquire()
+        self.assertAlmostEqual(1000.5, clock.now)
+        bucket.acquire()
+        self.assertAlmostEqual(1001.0, clock.now)
+
+    def test_tokens_refill(self):
+        clock = Clock()
+        bucket = RssTokenBucket(rate=1, burst=2, clock=clock, sleep=clock.sleep)
+        bucket.acquire()
+        bucket.acquire()
+        clock.now += 10
+        bucket.acquire()
+        bucket.acquire()
+        self.assertEqual(1010.0, clock.now)
+
+
+class RssHostHealthTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.health_file = self.directory.name + os.path.sep + "health"
+        self.clock = Clock()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def health(self):
+        return RssHostHealth(self.health_file, failure_threshold=2, cool_down=60, clock=self.clock)
+
+    def test_circuit_opens_after_threshold_and_closes_after_success(self):
+        health = self.health()
+        health.failure("host")
+        health.check("host")
+        health.failure("host")
+        with self.assertRaises(RssException):
+            health.check("host")
+        health.check("other")
+        self.clock.now += 60
+        health.check("host")
+        health.success("host")
+        health.failure("host")
+        health.check("host")
+
+    def test_state_is_persisted(self):
+        health = self.health()
+        health.failure("host")
+        health.failure("host")
+        with self.assertRaises(RssException):
+            self.health().check("host")
+
+    def test_state_is_merged_between_processes(self):
+        worker_a = self.health()
+        worker_b = self.health()
+        worker_a.failure("x")
+        worker_a.failure("x")
+        worker_b.failure("y")
+        # circuit opened by other process is seen without restart
+        with self.assertRaises(RssException):
+            worker_b.check("x")
+        with self.assertRaises(RssException):
+            self.health().check("x")
+        worker_b.failure("y")
+        with self.assertRaises(RssException):
+            worker_a.check("y")
+        worker_a.success("y")
+        self.health().check("y")
+        with self.assertRaises(RssException):
+            self.health().check("x")
+
+    def test_single_trial_request_after_cool_down(self):
+        worker_a = self.health()
+        worker_b = self.health()
+        worker_a.failure("host")
+        worker_a.failure("host")
+        self.clock.now += 60
+        worker_a.check("host")
+        with self.assertRaises(RssException):
+            worker_b.check("host")
+        # failed trial opens circuit again
+        worker_a.failure("host")
+        with self.assertRaises(RssException):
+            worker_a.check("host")
+        self.clock.now += 60
+        worker_b.check("host")
+        # trial which did not finish is replaced by another one after cool down
+        self.clock.now += 60
+        worker_a.check("host")
+        worker_a.success("host")
+        worker_b.check("host")
+        worker_b.check("host")
+
+    def test_rate_is_shared_between_processes(self):
+        workers = [self.health(), self.health()]
+        for i in range(4):
+            bucket = RssTokenBucket(rate=2, burst=2, clock=self.clock, sleep=self.clock.sleep)
+            workers[i % 2].acquire("host", bucket)
+        self.assertAlmostEqual(1001.0, self.clock.now)
+        workers[0].acquire("other", RssTokenBucket(rate=2, burst=2, clock=self.clock, sleep=self.clock.sleep))
+        self.assertAlmostEqual(1001.0, self.clock.now)
+        workers[0].failure("host")
+        workers[1].success("host")
+        workers[1].acquire("host", RssTokenBucket(rate=2, burst=2, clock=self.clock, sleep=self.clock.sleep))
+        self.assertAlmostEqual(1001.5, self.clock.now)
+
+    def test_broken_file_is_ignored(self):
+        with open(self.health_file, "w") as f:
+            f.write("broken")
+        self.health().check("host")
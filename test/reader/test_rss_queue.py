@@ -0,0 +1,61 @@
+import os
+import tempfile
+import unittest
+
+from reader.rss_queue import SqliteRssWorkQueue
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class SqliteRssWorkQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.clock = Clock()
+        self.queue = SqliteRssWorkQueue(self.directory.name + os.path.sep + "queue.db", clock=self.clock)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_add_is_idempotent(self):
+        self.queue.add("url1")
+        self.queue.add("url2")
+        self.queue.add("url1")
+        self.assertEqual(["url1", "url2"], self.queue.urls())
+
+    def test_lease_gives_each_url_to_single_worker(self):
+        self.queue.add("url1")
+        self.queue.add("url2")
+        leased = {self.queue.lease("worker1", 60), self.queue.lease("worker2", 60)}
+        self.assertEqual({"url1", "url2"}, leased)
+        self.assertIsNone(self.queue.lease("worker3", 60))
+
+    def test_lease_is_shared_between_queue_instances(self):
+        self.queue.add("url1")
+        other = SqliteRssWorkQueue(self.queue.queue_file, clock=self.clock)
+        self.assertEqual("url1", other.lease("worker1", 60))
+        self.assertIsNone(self.queue.lease("worker2", 60))
+
+    def test_completed_url_is_due_after_interval(self):
+        self.queue.add("url1")
+        self.queue.lease("worker1", 60)
+        self.assertTrue(self.queue.complete("url1", "worker1", 600))
+        self.clock.now += 599
+        self.assertIsNone(self.queue.lease("worker1", 60))
+        self.clock.now += 1
+        self.assertEqual("url1", self.queue.lease("worker1", 60))
+
+    def test_expired_lease_is_given_to_other_worker(self):
+        self.queue.add("url1")
+        self.queue.lease("dead-worker", 60)
+        self.clock.now += 59
+        self.assertIsNone(self.queue.lease("worker2", 60))
+        self.clock.now += 1
+        self.assertEqual("url1", self.queue.lease("worker2", 60))
+        self.assertFalse(self.queue.complete("url1", "dead-worker", 600))
+        self.assertTrue(self.queue.complete("url1", "worker2", 600))
@@ -1,12 +1,74 @@
 import logging
 import os
 import tempfile
+import threading
+import time
 import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 from reader.rss_document import RssDocument, RssItem
-from reader.rss_reader import RssReaderOptionsParser, RssReader, RssDownloader, RssException, RssCache
+from reader.rss_host_policy import RssHostHealth
+from reader.rss_queue import SqliteRssWorkQueue
+from reader.rss_reader import RssReaderOptionsParser, RssReader, RssDownloader, RssException, RssCache, RssWorker
 
 URL = "https://news.yahoo.com/rss/"
+FEED = b"""<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0">
+<channel>
+<title>stub feed</title>
+<lastBuildDate>Sat, 01 Jan 2022 10:00:00 GMT</lastBuildDate>
+<item>
+<title>item title</title>
+<link>http://stub/item</link>
+<pubDate>Sat, 01 Jan 2022 01:02:03 GMT</pubDate>
+</item>
+</channel>
+</rss>
+"""
+
+
+class StubServer:
+    """
+    Local http server serving FEED. Faults are injected per path as list of responses, where response is http status
+    or 'timeout'. When all faults of path were served, FEED is returned
+    """
+
+    def __init__(self, faults=None, delay=1.0):
+        self.faults = faults or {}
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.requests.append(self.path)
+                faults = stub.faults.get(self.path, [])
+                fault = faults.pop(0) if faults else 200
+                if fault == 'timeout':
+                    time.sleep(delay)
+                    fault = 200
+                try:
+                    self.send_response(fault)
+                    self.send_header("Content-Type", "application/rss+xml")
+                    self.send_header("Last-Modified", "Sat, 01 Jan 2022 10:00:00 GMT")
+                    self.end_headers()
+                    if fault == 200:
+                        self.wfile.write(FEED)
+                except ConnectionError:
+                    # client has already timed out
+                    pass
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def url(self, path):
+        return f"http://127.0.0.1:{self.server.server_port}{path}"
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
 
 
 def repeat_failed(times):
@@ -96,6 +158,57 @@ class RssDownloaderTest(unittest.TestCase):
             pass
 
 
+class RssDownloaderFaultsTest(unittest.TestCase):
+    def setUp(self):
+        self.sleeps = []
+        self.stub = StubServer()
+
+    def tearDown(self):
+        self.stub.close()
+
+    def downloader(self, **kwargs):
+        return RssDownloader(timeout=0.2, backoff=0.01, sleep=self.sleeps.append, **kwargs)
+
+    def test_download_from_stub(self):
+        document = self.downloader().download(self.stub.url("/feed"))
+        self.assertEqual("stub feed", document.title)
+        self.assertEqual("http://stub/item", document.items[0].link)
+
+    def test_retries_on_server_errors_and_timeouts(self):
+        self.stub.faults["/feed"] = [503, 'timeout', 429]
+        document = self.downloader().download(self.stub.url("/feed"))
+        self.assertEqual("stub feed", document.title)
+        self.assertEqual(4, len(self.stub.requests))
+        self.assertEqual(3, len(self.sleeps))
+        self.assertTrue(all(0 <= s <= 0.01 * 2 ** i for i, s in enumerate(self.sleeps)))
+
+    def test_does_not_retry_on_client_error(self):
+        self.stub.faults["/feed"] = [404]
+        with self.assertRaises(RssException):
+            self.downloader().download(self.stub.url("/feed"))
+        self.assertEqual(1, len(self.stub.requests))
+
+    def test_circuit_opens_for_failing_host(self):
+        health_file = tempfile.gettempdir() + os.path.sep + str(self)
+        try:
+            self.stub.faults["/dead"] = [500] * 4
+            downloader = self.downloader(retries=1, health=RssHostHealth(health_file, failure_threshold=2))
+            for i in range(3):
+                with self.assertRaises(RssException):
+                    downloader.download(self.stub.url("/dead"))
+            # third download is skipped without request to the host
+            self.assertEqual(4, len(self.stub.requests))
+            # state is persisted, so circuit remains open in next run
+            with self.assertRaises(RssException):
+                self.downloader(health=RssHostHealth(health_file)).download(self.stub.url("/feed"))
+            self.assertEqual(4, len(self.stub.requests))
+            # other hosts are not affected
+            other_host_url = self.stub.url("/feed").replace("127.0.0.1", "localhost")
+            self.downloader(health=RssHostHealth(health_file)).download(other_host_url)
+        finally:
+            os.remove(health_file)
+
+
 class RssCacheTest(unittest.TestCase):
     def test_store_and_load(self):
         cache = RssCache()
@@ -120,9 +233,191 @@ class RssCacheTest(unittest.TestCase):
             pass
 
 
+class FakeDownloader(RssDownloader):
+    """
+    Serves FEED with title set to url, or body of url when specified
+    """
+
+    def __init__(self, failing=(), bodies=None):
+        super().__init__()
+        self.failing = failing
+        self.bodies = bodies or {}
+        self.downloaded = []
+        self.parsed = 0
+
+    def fetch(self, url):
+        self.downloaded.append(url)
+        if url in self.failing:
+            raise RssException(f"Failed to download {url}")
+        body = self.bodies.get(url, FEED.replace(b"stub feed", url.encode("utf-8")))
+        return body, {'content-type': 'application/rss+xml', 'last-modified': 'updated'}
+
+    def parse(self, body, headers):
+        self.parsed += 1
+        return super().parse(body, headers)
+
+
+class RssWorkerTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.queue = SqliteRssWorkQueue(self.directory.name + os.path.sep + "queue.db")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def worker(self, worker_id, downloader):
+        return RssWorker(self.queue, downloader, cache_dir=self.directory.name, worker_id=worker_id)
+
+    def test_poll_stores_feeds_to_cache(self):
+        self.queue.add("url1")
+        self.queue.add("url2")
+        downloader = FakeDownloader()
+        worker = self.worker("worker1", downloader)
+        self.assertEqual(2, worker.run(max_polls=2))
+        self.assertIsNone(worker.poll())
+        self.assertEqual(["url1", "url2"], sorted(downloader.downloaded))
+        self.assertEqual("url1", RssCache.for_feed("url1", self.directory.name).load().title)
+        self.assertEqual("url2", RssCache.for_feed("url2", self.directory.name).load().title)
+
+    def test_each_feed_is_polled_by_single_worker(self):
+        for i in range(10):
+            self.queue.add(f"url{i}")
+        downloaders = [FakeDownloader(), FakeDownloader()]
+        workers = [self.worker(f"worker{i}", d) for i, d in enumerate(downloaders)]
+        while any([w.poll() for w in workers]):
+            pass
+        downloaded = downloaders[0].downloaded + downloaders[1].downloaded
+        self.assertEqual(sorted(self.queue.urls()), sorted(downloaded))
+
+    def test_failed_feed_does_not_stop_worker(self):
+        self.queue.add("url1")
+        self.queue.add("url2")
+        worker = self.worker("worker1", FakeDownloader(failing=["url1"]))
+        self.assertEqual(2, worker.run(max_polls=2))
+        self.assertEqual("url2", RssCache.for_feed("url2", self.directory.name).load().title)
+
+    def test_queue_failure_does_not_stop_worker(self):
+        self.queue.add("url1")
+
+        def complete(url, worker_id, interval):
+            raise SqliteRssWorkQueue.RssWorkQueueException("database is locked")
+
+        self.queue.complete = complete
+        worker = self.worker("worker1", FakeDownloader(failing=["url1"]))
+        self.assertEqual("url1", worker.poll())
+        worker = self.worker("worker2", FakeDownloader())
+        self.assertIsNone(worker.poll())
+
+    def test_lease_failure_does_not_stop_worker(self):
+        self.queue.add("url1")
+        lease = self.queue.lease
+        failures = ["database is locked"]
+
+        def failing_lease(worker_id, lease_seconds):
+            if failures:
+                raise SqliteRssWorkQueue.RssWorkQueueException(failures.pop())
+            return lease(worker_id, lease_seconds)
+
+        self.queue.lease = failing_lease
+        worker = self.worker("worker1", FakeDownloader())
+        self.assertEqual(1, worker.run(idle_sleep=0, max_polls=1))
+        self.assertEqual("url1", RssCache.for_feed("url1", self.directory.name).load().title)
+
+
+class RssCacheUpdateTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = RssCache(self.directory.name + os.path.sep + "rss-reader.cache")
+        self.stored = []
+        store = self.cache.store
+        self.cache.store = lambda document: self.stored.append(document) or store(document)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_unchanged_body_is_not_parsed_nor_stored(self):
+        downloader = FakeDownloader()
+        self.cache.update("url", downloader)
+        os.utime(self.cache.fingerprints_file, (0, 0))
+        document = self.cache.update("url", downloader)
+        self.assertEqual("url", document.title)
+        self.assertEqual(1, downloader.parsed)
+        self.assertEqual(1, len(self.stored))
+        # fingerprints are not rewritten
+        self.assertEqual(0, os.path.getmtime(self.cache.fingerprints_file))
+
+    def test_unchanged_cache_is_not_loaded_when_not_needed(self):
+        downloader = FakeDownloader()
+        self.cache.update("url", downloader)
+        self.cache.load = None
+        self.assertIsNone(self.cache.update("url", downloader, load=False))
+        os.remove(self.cache.cache_file)
+        self.assertEqual("url", self.cache.update("url", downloader, load=False).title)
+        self.assertEqual(2, len(self.stored))
+
+    def test_unchanged_document_is_not_stored(self):
+        downloader = FakeDownloader()
+        self.cache.update("url", downloader)
+        # description is not stored in cache
+        downloader.bodies["url"] = FEED.replace(b"stub feed", b"url") \
+            .replace(b"<item>", b"<item><description>ignored</description>")
+        self.cache.update("url", downloader)
+        self.assertEqual(2, downloader.parsed)
+        self.assertEqual(1, len(self.stored))
+
+    def test_changed_feed_fields_are_stored(self):
+        body = FEED.replace(b'<rss version="2.0">', b'<rss version="2.0" xmlns:media="http://search.yahoo.com/mrss/">')
+        downloader = FakeDownloader(bodies={"url": body})
+        self.cache.update("url", downloader)
+        for old, new in [(b"01:02:03", b"04:05:06"),
+                         (b"stub feed", b"new title"),
+                         (b"<item>", b'<item><media:content url="http://stub/image.png" medium="image"/>')]:
+            body = downloader.bodies["url"] = body.replace(old, new)
+            self.cache.update("url", downloader)
+        self.assertEqual(4, len(self.stored))
+        cached = self.cache.load()
+        self.assertEqual("new title", cached.title)
+        self.assertEqual("http://stub/image.png", cached.items[0].image_link)
+
+    def test_changed_items_are_stored(self):
+        downloader = FakeDownloader()
+        self.cache.update("url", downloader)
+        downloader.bodies["url"] = FEED.replace(b"item title", b"new title")
+        document = self.cache.update("url", downloader)
+        self.assertEqual("new title", document.items[0].title)
+        self.assertEqual(2, len(self.stored))
+        self.assertEqual("new title", self.cache.load().items[0].title)
+
+    def test_other_url_or_document_stored_directly_is_not_reused(self):
+        downloader = FakeDownloader(bodies={"url1": FEED, "url2": FEED})
+        self.cache.update("url1", downloader)
+        self.cache.update("url2", downloader)
+        self.assertEqual(2, len(self.stored))
+        self.cache.store(RssDocument('title', 'updated', []))
+        self.assertEqual("stub feed", self.cache.update("url2", downloader).title)
+
+    def test_concurrent_merges_keep_all_items(self):
+        self.cache.store(RssDocument("title", "updated", [RssItem("cached", "link", "date")]))
+
+        def merge(i):
+            self.cache.merge(RssDocument("title", "updated", [RssItem(f"item{i}", f"link{i}", "date")]))
+
+        threads = [threading.Thread(target=merge, args=(i,)) for i in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(["cached"] + [f"item{i}" for i in range(10)], sorted(i.title for i in self.cache.load().items))
+
+
 class RssReaderTest(unittest.TestCase):
     def setUp(self) -> None:
-        pass
+        # tests must not change health of hosts used by real runs
+        self.directory = tempfile.TemporaryDirectory()
+        self.health_file = self.directory.name + os.path.sep + "rss-reader.health"
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
 
     def test_help(self):
         try:
@@ -145,8 +440,21 @@ class RssReaderTest(unittest.TestCase):
         except SystemExit as e:
             self.assertEqual(3, e.code)
 
+    def test_worker_without_queue(self):
+        try:
+            RssReader(['--worker'])
+            self.fail('should fail when --worker is specified without --queue')
+        except SystemExit as e:
+            self.assertEqual(3, e.code)
+
+    def test_add_url_to_queue(self):
+        with tempfile.TemporaryDirectory() as directory:
+            queue_file = directory + os.path.sep + "queue.db"
+            RssReader.run(['--queue', queue_file, 'url'])
+            self.assertEqual(['url'], SqliteRssWorkQueue(queue_file).urls())
+
     def test_logs_on_verbose(self):
-        RssReader(['--verbose', 'url'])
+        RssReader(['--verbose', '--health-file', self.health_file, 'url'])
         logging.getLogger(str(self)).debug("should be printed")
 
     def test_logs_when_no_verbose(self):
@@ -154,7 +462,7 @@ class RssReaderTest(unittest.TestCase):
         logging.getLogger(str(self)).debug("no output should be present")
 
     def test_download_url_fails_on_unknown_url(self):
-        reader = RssReader(['--verbose', 'https://unknown-url'])
+        reader = RssReader(['--verbose', '--health-file', self.health_file, 'https://unknown-url'])
         try:
             reader.load_rss()
             self.fail('Should fail for unknown url')
@@ -162,21 +470,22 @@ class RssReaderTest(unittest.TestCase):
             self.assertTrue('Failed to download url / parse document' in str(e))
 
     def test_download_url(self):
-        document = RssReader(['--verbose', URL]).load_rss()
+        document = RssReader(['--verbose', '--health-file', self.health_file, URL]).load_rss()
 
     def test_download_url_with_limit(self):
-        reader = RssReader(['--verbose', '--limit', '1', URL])
+        reader = RssReader(['--verbose', '--health-file', self.health_file, '--limit', '1', URL])
         reader.load_rss()
         self.assertEqual(1, len(reader.document.items))
 
     @repeat_failed(10)  # can happen, that new feed is posted between two downloads, in that case we repeat the check
     def test_download_url_with_too_large_limit(self):
-        document_unlimited = RssReader(['--verbose', URL]).load_rss()
-        document_limited = RssReader(['--verbose', '--limit', '100000', URL]).load_rss()
+        document_unlimited = RssReader(['--verbose', '--health-file', self.health_file, URL]).load_rss()
+        document_limited = RssReader(
+            ['--verbose', '--health-file', self.health_file, '--limit', '100000', URL]).load_rss()
         self.assertEqual(str(document_unlimited), str(document_limited))
 
     def test_load_from_cache_with_date(self):
-        reader = RssReader(['--verbose', '--date', '20220101'])
+        reader = RssReader(['--verbose', '--health-file', self.health_file, '--date', '20220101'])
         reader.cache.store(RssDocument("title",
                                        "updated",
                                        [
@@ -188,7 +497,7 @@ class RssReaderTest(unittest.TestCase):
 
     def test_load_from_cache_with_date_and_limit(self):
         date = '2022-01-01T01:02:03Z'
-        reader = RssReader(['--verbose', '--date', '20220101', '--limit', '1'])
+        reader = RssReader(['--verbose', '--health-file', self.health_file, '--date', '20220101', '--limit', '1'])
         reader.cache.store(RssDocument("title",
                                        "updated",
                                        [
@@ -199,7 +508,7 @@ class RssReaderTest(unittest.TestCase):
         self.assertEqual(str([RssItem("title1", "link1", date)]), str(document.items))
 
     def test_load_from_cache_with_date_fail_when_no_items_are_present(self):
-        reader = RssReader(['--verbose', '--date', '20300101'])
+        reader = RssReader(['--verbose', '--health-file', self.health_file, '--date', '20300101'])
         reader.cache.store(RssDocument("title",
                                        "updated",
                                        [
@@ -216,8 +525,28 @@ class RssReaderTest(unittest.TestCase):
 
     def test_generate_html(self):
         file = tempfile.gettempdir() + os.path.sep + str(self)
-        reader = RssReader(['--verbose', URL, '--to-html', file + ".1.html", '--to-html', file + ".2.html"])
+        reader = RssReader(['--verbose', '--health-file', self.health_file, URL,
+                            '--to-html', file + ".1.html", '--to-html', file + ".2.html"])
         reader.load_rss()
         generated = reader.generate_files()
         self.assertEqual(2, len(generated))
         logging.getLogger().info("Generated files %s", generated)
+
+    def test_generate_html_skips_unchanged_files(self):
+        with tempfile.TemporaryDirectory() as directory:
+            file = directory + os.path.sep + "feed.html"
+            reader = RssReader(['--verbose', '--health-file', self.health_file, 'url', '--to-html', file])
+            reader.cache = RssCache(directory + os.path.sep + "rss-reader.cache")
+            reader.downloader = FakeDownloader()
+            reader.load_rss()
+            self.assertEqual([file], reader.generate_files())
+            os.utime(file, (0, 0))
+            os.utime(reader.cache.fingerprints_file, (0, 0))
+            reader.load_rss()
+            self.assertEqual([file], reader.generate_files())
+            self.assertEqual(0, os.path.getmtime(file))
+            self.assertEqual(0, os.path.getmtime(reader.cache.fingerprints_file))
+            reader.downloader.bodies["url"] = FEED.replace(b"item title", b"new title")
+            reader.load_rss()
+            reader.generate_files()
+            self.assertNotEqual(0, os.path.getmtime(file))
@@ -0,0 +1,173 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime
+
+from reader.rss_document import RssDocument, RssItem
+from reader.rss_reader import RssReader, RssCache
+from reader.rss_snapshot import RssSnapshot
+
+DOCUMENTS = [
+    RssDocument("feed1", "updated1", [
+        RssItem("title1", "link1", "2022-01-01T01:02:03Z"),
+        RssItem("title2", "link2", "2022-01-02T01:02:03Z"),
+        RssItem("title3", "link3", "invalid date"),
+    ]),
+    RssDocument("feed2", "updated2", [
+        RssItem("title4", "link4", "2022-01-01T10:00:00Z"),
+    ]),
+]
+METADATA = [
+    {'cache_file': 'cache1', 'sequence': 1},
+    {'cache_file': 'cache2', 'sequence': 2},
+]
+FEEDS = [(METADATA[0], RssSnapshot.item_days(DOCUMENTS[0])), (METADATA[1], RssSnapshot.item_days(DOCUMENTS[1]))]
+
+
+class RssSnapshotTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.snapshot_file = self.directory.name + os.path.sep + "snapshot"
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_write_and_open(self):
+        RssSnapshot.write(self.snapshot_file, 42, FEEDS)
+        snapshot = RssSnapshot.open(self.snapshot_file, 42)
+        try:
+            self.assertEqual(METADATA, snapshot.feeds)
+            self.assertEqual([(0, 0), (1, 0)], snapshot.items_on(datetime(2022, 1, 1)))
+            self.assertEqual([(0, 1)], snapshot.items_on(datetime(2022, 1, 2)))
+            self.assertEqual([], snapshot.items_on(datetime(2021, 1, 1)))
+            self.assertEqual([], snapshot.items_on(datetime(2030, 1, 1)))
+            self.assertEqual({0: FEEDS[0][1], 1: FEEDS[1][1]}, snapshot.feed_days())
+        finally:
+            snapshot.close()
+
+    def test_open_empty_snapshot(self):
+        RssSnapshot.write(self.snapshot_file, 1, [])
+        snapshot = RssSnapshot.open(self.snapshot_file, 1)
+        self.assertEqual([], snapshot.items_on(datetime(2022, 1, 1)))
+        self.assertEqual({}, snapshot.feed_days())
+        snapshot.close()
+
+    def test_open_fails_on_sequence_mismatch(self):
+        RssSnapshot.write(self.snapshot_file, 42, FEEDS)
+        self.assertIsNone(RssSnapshot.open(self.snapshot_file, 43))
+
+    def test_open_fails_on_missing_or_broken_snapshot(self):
+        self.assertIsNone(RssSnapshot.open(self.snapshot_file, 42))
+        with open(self.snapshot_file, "wb") as f:
+            f.write(b"broken")
+        self.assertIsNone(RssSnapshot.open(self.snapshot_file, 42))
+        data = RssSnapshot.build(42, FEEDS)
+        with open(self.snapshot_file, "wb") as f:
+            f.write(data[:-1])
+        self.assertIsNone(RssSnapshot.open(self.snapshot_file, 42))
+        with open(self.snapshot_file, "wb") as f:
+            f.write(data[:4] + b"\x01" + data[5:])
+        self.assertIsNone(RssSnapshot.open(self.snapshot_file, 42))
+
+    def test_open_or_rebuild_loads_only_changed_feeds(self):
+        metadata = [dict(m) for m in METADATA]
+        loaded = []
+
+        def load_feed(meta):
+            loaded.append(meta['cache_file'])
+            return meta, DOCUMENTS[metadata.index(meta)]
+
+        RssSnapshot.open_or_rebuild(self.snapshot_file, 1, lambda: metadata, load_feed).close()
+        RssSnapshot.open_or_rebuild(self.snapshot_file, 1, lambda: metadata, load_feed).close()
+        self.assertEqual(['cache1', 'cache2'], loaded)
+        metadata[1]['sequence'] = 3
+        snapshot = RssSnapshot.open_or_rebuild(self.snapshot_file, 2, lambda: metadata, load_feed)
+        try:
+            self.assertEqual(['cache1', 'cache2', 'cache2'], loaded)
+            self.assertEqual(metadata, snapshot.feeds)
+            self.assertEqual([(0, 0), (1, 0)], snapshot.items_on(datetime(2022, 1, 1)))
+        finally:
+            snapshot.close()
+        RssSnapshot.open_or_rebuild(self.snapshot_file, 2, lambda: metadata, load_feed, rebuild=True).close()
+        self.assertEqual(3, len(loaded))
+
+    def test_feed_failing_to_load_is_skipped(self):
+        def load_feed(meta):
+            if meta['cache_file'] == 'cache1':
+                raise RssCache.RssCacheException("broken")
+            return meta, DOCUMENTS[1]
+
+        snapshot = RssSnapshot.open_or_rebuild(self.snapshot_file, 1, lambda: METADATA, load_feed)
+        try:
+            self.assertEqual([METADATA[1]], snapshot.feeds)
+            self.assertEqual([(0, 0)], snapshot.items_on(datetime(2022, 1, 1)))
+        finally:
+            snapshot.close()
+
+
+class RssReaderSnapshotTest(unittest.TestCase):
+    def test_load_from_cache_dir_with_snapshot(self):
+        with tempfile.TemporaryDirectory() as directory:
+            snapshot_file = directory + os.path.sep + "snapshot"
+            RssCache.for_feed("url1", directory).store(DOCUMENTS[0])
+            RssCache.for_feed("url2", directory).store(DOCUMENTS[1])
+            args = ['--cache-dir', directory, '--snapshot', snapshot_file, '--date', '20220101']
+            document = RssReader(args).load_rss()
+            self.assertEqual(['title1', 'title4'], sorted(i.title for i in document.items))
+            self.assertIn(document.title, ["feed1, feed2", "feed2, feed1"])
+            sequence = RssCache.sequence(directory)
+            # stored cache changes sequence, so snapshot is rebuilt
+            RssCache.for_feed("url2", directory).store(RssDocument("feed2", "updated", []))
+            self.assertNotEqual(sequence, RssCache.sequence(directory))
+            document = RssReader(args).load_rss()
+            self.assertEqual(['title1'], [i.title for i in document.items])
+
+    def test_cache_changed_after_snapshot_was_built_is_not_misread(self):
+        with tempfile.TemporaryDirectory() as directory:
+            snapshot_file = directory + os.path.sep + "snapshot"
+            RssCache.for_feed("url1", directory).store(DOCUMENTS[0])
+            RssCache.for_feed("url2", directory).store(DOCUMENTS[1])
+            args = ['--cache-dir', directory, '--snapshot', snapshot_file, '--date', '20220101']
+            RssReader(args).load_rss()
+            RssCache.for_feed("url2", directory).store(RssDocument("feed2", "updated", [
+                RssItem("title5", "link5", "2022-01-02T10:00:00Z"),
+                RssItem("title6", "link6", "2022-01-01T10:00:00Z"),
+            ]))
+            # simulates cache stored between opening snapshot and loading the cache
+            with open(snapshot_file, "rb") as f:
+                data = bytearray(f.read())
+            RssSnapshot.HEADER.pack_into(data, 0, *RssSnapshot.HEADER.unpack_from(data, 0)[:3],
+                                         RssCache.sequence(directory), *RssSnapshot.HEADER.unpack_from(data, 0)[4:])
+            with open(snapshot_file, "wb") as f:
+                f.write(data)
+            document = RssReader(args).load_rss()
+            self.assertEqual(['title1', 'title6'], sorted(i.title for i in document.items))
+
+    def test_cache_stored_within_same_time_and_size_is_not_misread(self):
+        with tempfile.TemporaryDirectory() as directory:
+            snapshot_file = directory + os.path.sep + "snapshot"
+            cache = RssCache.for_feed("url1", directory)
+            cache.store(DOCUMENTS[0])
+            args = ['--cache-dir', directory, '--snapshot', snapshot_file, '--date', '20220101']
+            self.assertEqual(['title1'], [i.title for i in RssReader(args).load_rss().items])
+            stat = os.stat(cache.cache_file)
+            # items of the same size in other order, stored within the same tick of modification time
+            cache.store(RssDocument("feed1", "updated1", [
+                RssItem("title3", "link3", "invalid date"),
+                RssItem("title1", "link1", "2022-01-01T01:02:03Z"),
+                RssItem("title2", "link2", "2022-01-02T01:02:03Z"),
+            ]))
+            os.utime(cache.cache_file, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+            self.assertEqual(stat.st_size, os.path.getsize(cache.cache_file))
+            self.assertEqual(['title1'], [i.title for i in RssReader(args).load_rss().items])
+
+    def test_store_increases_sequence(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.assertEqual(0, RssCache.sequence(directory))
+            RssCache.for_feed("url1", directory).store(DOCUMENTS[0])
+            RssCache.for_feed("url2", directory).store(DOCUMENTS[1])
+            self.assertEqual(2, RssCache.sequence(directory))
+            self.assertEqual(2, RssCache.for_feed("url2", directory).metadata()['sequence'])
+            sequence, document = RssCache.for_feed("url1", directory).load_stored()
+            self.assertEqual(1, sequence)
+            self.assertEqual("feed1", document.title)
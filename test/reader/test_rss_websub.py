@@ -0,0 +1,237 @@
+import hashlib
+import hmac
+import os
+import tempfile
+import threading
+import time
+import unittest
+import urllib.parse
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from reader.rss_document import RssDocument, RssItem
+from reader.rss_exception import RssException
+from reader.rss_reader import RssCache
+from reader.rss_websub import RssWebSubSubscriber
+
+
+def feed(hub_url, item_title, item_link="http://publisher/item"):
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0" xmlns:atom="http://www.w3.org/2005/Atom">
+<channel>
+<title>pushed feed</title>
+<atom:link rel="hub" href="{hub_url}"/>
+<atom:link rel="self" href="http://publisher/feed"/>
+<lastBuildDate>Sat, 01 Jan 2022 10:00:00 GMT</lastBuildDate>
+<item>
+<title>{item_title}</title>
+<link>{item_link}</link>
+<pubDate>Sat, 01 Jan 2022 01:02:03 GMT</pubDate>
+</item>
+</channel>
+</rss>
+""".encode("utf-8")
+
+
+class StubHub:
+    """
+    Hub verifying subscriptions asynchronously, as real hubs do, and distributing content on publish()
+    """
+
+    def __init__(self):
+        self.subscriptions = {}
+        self.verified = threading.Event()
+        self.verifying = True
+        self.threads = []
+        hub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                params = dict(urllib.parse.parse_qsl(body.decode("utf-8")))
+                hub.subscriptions[params['hub.topic']] = params
+                self.send_response(202)
+                self.end_headers()
+                if hub.verifying:
+                    thread = threading.Thread(target=hub.verify, args=(params,))
+                    hub.threads.append(thread)
+                    thread.start()
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}/hub"
+
+    def verify(self, params):
+        query = urllib.parse.urlencode({
+            'hub.mode': 'subscribe',
+            'hub.topic': params['hub.topic'],
+            'hub.challenge': 'challenge123',
+            'hub.lease_seconds': 100,
+        })
+        with urllib.request.urlopen(f"{params['hub.callback']}?{query}") as response:
+            if response.read() == b'challenge123':
+                self.verified.set()
+
+    def publish(self, topic, body, secret=None):
+        params = self.subscriptions[topic]
+        signature = hmac.new((secret or params['hub.secret']).encode("utf-8"), body, hashlib.sha256).hexdigest()
+        request = urllib.request.Request(params['hub.callback'], data=body,
+                                         headers={'X-Hub-Signature': f"sha256={signature}"})
+        with urllib.request.urlopen(request) as response:
+            return response.status
+
+    def close(self):
+        for thread in self.threads:
+            thread.join(5)
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class FakeDownloader:
+    def __init__(self, documents):
+        self.documents = documents
+        self.downloaded = []
+
+    def download(self, url):
+        self.downloaded.append(url)
+        if url not in self.documents:
+            raise RssException(f"Failed to download {url}")
+        return self.documents[url]
+
+
+class Clock:
+    def __init__(self):
+        self.now = time.time()
+
+    def __call__(self):
+        return self.now
+
+
+class RssWebSubSubscriberTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.subscriptions_file = self.directory.name + os.path.sep + "websub"
+        self.stored = {}
+        self.clock = Clock()
+        self.hub = StubHub()
+        self.subscriber = self.create_subscriber()
+        self.server = self.subscriber.serve("127.0.0.1", 0)
+        self.subscriber.callback_url = f"http://127.0.0.1:{self.server.server_port}/websub"
+
+    def tearDown(self):
+        # verifications in progress need the callback endpoint
+        self.hub.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.directory.cleanup()
+
+    def create_subscriber(self):
+        def store(url, document):
+            self.stored[url] = document
+
+        return RssWebSubSubscriber("http://unused", store, self.subscriptions_file, clock=self.clock)
+
+    def subscribe(self):
+        document = RssDocument("pushed feed", "updated", [], hub=self.hub.url, self_link="http://publisher/feed")
+        downloader = FakeDownloader({"http://publisher/feed.xml": document})
+        self.assertEqual(["http://publisher/feed.xml"], self.subscriber.poll(["http://publisher/feed.xml"], downloader))
+        self.assertTrue(self.hub.verified.wait(5))
+        self.assertTrue(self.subscriber.is_active("http://publisher/feed.xml"))
+        return downloader
+
+    def test_subscribe_and_receive_pushed_content(self):
+        downloader = self.subscribe()
+        self.assertEqual(204, self.hub.publish("http://publisher/feed", feed(self.hub.url, "pushed item")))
+        document = self.stored["http://publisher/feed.xml"]
+        self.assertEqual("pushed feed", document.title)
+        self.assertEqual("pushed item", document.items[0].title)
+        self.assertEqual(self.hub.url, document.hub)
+        # subscribed feed is not polled anymore
+        self.assertEqual([], self.subscriber.poll(["http://publisher/feed.xml"], downloader))
+        self.assertEqual(1, len(downloader.downloaded))
+
+    def test_pushed_items_are_merged_into_cache(self):
+        url = "http://publisher/feed.xml"
+        cache = RssCache.for_feed(url, self.directory.name)
+        cache.store(RssDocument("pushed feed", "updated", [
+            RssItem("item", "http://publisher/item", "Sat, 01 Jan 2022 01:02:03 GMT"),
+            RssItem("older item", "http://publisher/older", "Fri, 31 Dec 2021 01:02:03 GMT"),
+        ]))
+        self.subscriber.on_push = lambda u, document: RssCache.for_feed(u, self.directory.name).merge(document)
+        self.subscribe()
+        self.assertEqual(204, self.hub.publish("http://publisher/feed", feed(self.hub.url, "changed item")))
+        self.assertEqual(204, self.hub.publish("http://publisher/feed",
+                                               feed(self.hub.url, "new item", "http://publisher/new")))
+        self.assertEqual(["new item", "changed item", "older item"], [i.title for i in cache.load().items])
+
+    def test_content_with_invalid_signature_is_ignored(self):
+        self.subscribe()
+        self.assertEqual(202, self.hub.publish("http://publisher/feed", feed(self.hub.url, "forged"), secret="wrong"))
+        self.assertEqual([], self.stored["http://publisher/feed.xml"].items)
+
+    def test_subscription_is_renewed_and_polled_after_expiration(self):
+        downloader = self.subscribe()
+        self.hub.verified.clear()
+        # within last tenth of lease subscription is renewed
+        self.clock.now += 95
+        self.subscriber.poll(["http://publisher/feed.xml"], downloader)
+        self.assertTrue(self.hub.verified.wait(5))
+        self.assertEqual(1, len(downloader.downloaded))
+        # when hub does not renew lease, feed is polled again
+        self.hub.verifying = False
+        self.clock.now += 1000
+        self.subscriber.poll(["http://publisher/feed.xml"], downloader)
+        self.assertEqual(2, len(downloader.downloaded))
+
+    def test_subscriptions_are_persisted(self):
+        self.subscribe()
+        self.assertTrue(self.create_subscriber().is_active("http://publisher/feed.xml"))
+
+    def test_feed_without_hub_is_polled(self):
+        downloader = FakeDownloader({"url": RssDocument("title", "updated", [RssItem("title", "link", "date")])})
+        self.assertEqual(["url"], self.subscriber.poll(["url"], downloader))
+        self.assertEqual(["url"], self.subscriber.poll(["url", "failing"], downloader))
+        self.assertEqual({}, self.hub.subscriptions)
+        self.assertFalse(self.subscriber.is_active("url"))
+
+    def verification(self, path, **params):
+        query = urllib.parse.urlencode({'hub.challenge': 'forged', **params})
+        with urllib.request.urlopen(f"{self.subscriber.callback_url}/{path}?{query}") as response:
+            return response.read()
+
+    def test_forged_verification_is_rejected(self):
+        url = "http://publisher/feed.xml"
+        self.subscribe()
+        token = self.subscriber.subscriptions[url]['token']
+        expires = self.subscriber.subscriptions[url]['expires']
+        hashed_url = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        for path, mode in [(hashed_url, 'subscribe'), (token, 'subscribe'), (token, 'unsubscribe')]:
+            with self.assertRaises(urllib.error.HTTPError) as e:
+                self.verification(path, **{'hub.mode': mode, 'hub.topic': "http://publisher/feed",
+                                           'hub.lease_seconds': 1000000000})
+            self.assertEqual(404, e.exception.code)
+        self.assertEqual(expires, self.subscriber.subscriptions[url]['expires'])
+        self.assertTrue(self.subscriber.is_active(url))
+
+    def test_invalid_lease_is_rejected_and_long_lease_is_capped(self):
+        url = "http://publisher/feed.xml"
+        self.subscriber.subscribe(url, self.hub.url, "http://publisher/feed")
+        self.assertTrue(self.hub.verified.wait(5))
+        self.subscriber.subscriptions[url]['requested'] = self.clock.now
+        token = self.subscriber.subscriptions[url]['token']
+        for lease in ['abc', '-1']:
+            with self.assertRaises(urllib.error.HTTPError) as e:
+                self.verification(token, **{'hub.mode': 'subscribe', 'hub.topic': "http://publisher/feed",
+                                            'hub.lease_seconds': lease})
+            self.assertEqual(400, e.exception.code)
+        self.assertEqual(b'forged', self.verification(token, **{
+            'hub.mode': 'subscribe', 'hub.topic': "http://publisher/feed", 'hub.lease_seconds': 1000000000}))
+        self.assertEqual(RssWebSubSubscriber.MAX_LEASE_SECONDS, self.subscriber.subscriptions[url]['lease_seconds'])
+
+    def test_unknown_verification_is_rejected(self):
+        query = urllib.parse.urlencode({'hub.mode': 'subscribe', 'hub.topic': 'topic', 'hub.challenge': 'x'})
+        with self.assertRaises(urllib.error.HTTPError):
+            urllib.request.urlopen(f"{self.subscriber.callback_url}/unknown?{query}")